@@ -2,6 +2,7 @@
 
 import sqlite3
 import os
+import posixpath
 import sys
 import glob
 import re
@@ -13,15 +14,39 @@ import tempfile
 import argparse
 import urllib.parse
 import urllib
+import urllib.error
 import time
 import collections
+import stat
+import threading
+import concurrent.futures
+import multiprocessing
+import queue
+import hashlib
+import struct
+import zlib
+import itertools
+import bisect
+import random
+import email.utils
+import cProfile
+import http.server
+import socketserver
+import asyncio
+import importlib.util
+import signal
 
 import requests
 from requests.adapters import HTTPAdapter
 from requests.packages.urllib3.util.retry import Retry
-from requests.exceptions import ConnectionError
-from bs4 import BeautifulSoup as bs, Tag # pip install bs4
+from requests.exceptions import ConnectionError, RetryError
+try:
+    import httpx # optional, see AsyncHttpClient
+except ImportError:
+    httpx = None
+from bs4 import BeautifulSoup as bs, Tag, NavigableString, Comment, FeatureNotFound # pip install bs4
 from selenium import webdriver
+from selenium.common.exceptions import WebDriverException
 # from selenium.webdriver import Firefox
 # from selenium.webdriver.firefox.options import Options
 # from selenium.webdriver.firefox.firefox_binary import FirefoxBinary
@@ -30,61 +55,140 @@ from selenium.webdriver import Chrome
 from selenium.webdriver.chrome.options import Options
 
 class PoshWebDriver:
-    """ Thin wrapper for selenium webdriver for page content retrieval """
+    """ 
+    Pool of selenium webdrivers for page content retrieval.
+    Drivers are launched on demand, health checked and reused across pages (and builds) until quit() is called.
+    """
 
-    def __init__(self, executable_path = None):
+    def __init__(self, executable_path = None, max_drivers : int = 1):
 
         self.options = Options()
         self.options.add_argument("--headless")
         self.options.add_argument("--window-size=1920x1080")
 
-        self.driver = webdriver.Chrome(options=self.options)
+        # idle drivers, most recently used first
+        self.idle_drivers = queue.LifoQueue()
+        self.drivers = []
+        self.drivers_lock = threading.Lock()
+        self.available = threading.BoundedSemaphore(max(1, max_drivers))
 
         # self.driver_exe_path = executable_path
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.quit()
+
+    def _start_driver(self):
+        logging.debug("webdriver : starting Chrome")
+        driver = webdriver.Chrome(options=self.options)
+
         # if self.driver_exe_path:
         #     binary = FirefoxBinary(executable_path)
-        #     self.driver = webdriver.Firefox(
+        #     driver = webdriver.Firefox(
         #         firefox_binary=binary,
         #         options=options,
         #     )
         # else:
-        #     self.driver = webdriver.Firefox(
+        #     driver = webdriver.Firefox(
         #         options=options
         #     )
 
+        with self.drivers_lock:
+            self.drivers.append(driver)
+        return driver
+
+    def _stop_driver(self, driver):
+        with self.drivers_lock:
+            if driver in self.drivers:
+                self.drivers.remove(driver)
+
+        try:
+            driver.quit()
+        except (WebDriverException, OSError, urllib.error.URLError):
+            pass
+
+    def _healthy(self, driver):
+        """ check an idle driver session is still responding """
+        try:
+            driver.current_url
+        except (WebDriverException, OSError, urllib.error.URLError):
+            return False
+        return True
+
+    def _acquire(self):
+        self.available.acquire()
+
+        while True:
+            try:
+                driver = self.idle_drivers.get_nowait()
+            except queue.Empty:
+                break
+
+            if self._healthy(driver):
+                return driver
+
+            logging.debug("webdriver : discarding unresponsive driver")
+            self._stop_driver(driver)
+
+        try:
+            return self._start_driver()
+        except:
+            self.available.release()
+            raise
+
+    def _release(self, driver, healthy : bool = True):
+        if healthy:
+            self.idle_drivers.put(driver)
+        else:
+            self._stop_driver(driver)
+        self.available.release()
+
     def get_url_page(self, url):
         """ retrieve the full html content of a page after Javascript execution """
         
-        index_html = None
-        try:
-            self.driver.get(url)
-            index_html = self.driver.page_source
-        except (ConnectionResetError, urllib.error.URLError) as e:
-            # we may have a triggered a anti-scraping time ban
-            # Lay low for several seconds and get back to it.
-
-            self.driver.quit()
-            time.sleep(2)
-            
-            # if self.driver_exe_path:
-            #     self.driver = webdriver.PhantomJS(executable_path = self.driver_exe_path)
-            # else:
-            #     self.driver = webdriver.PhantomJS()
-
-            self.driver = webdriver.Chrome(options=self.options)
-                
-            index_html = None
-
-        # try a second time, and raise error if fail
-        if not index_html:
-            self.driver.get(url)
-            index_html = self.driver.page_source
+        # retries and backoff delays are handled by the rate limiter shared with the downloads
+        for attempt in itertools.count():
+            driver = self._acquire()
+            rate_limiter.acquire()
+            try:
+                driver.get(url)
+                index_html = driver.page_source
+            except (ConnectionResetError, urllib.error.URLError, WebDriverException) as e:
+                # we may have a triggered a anti-scraping time ban
+                # Lay low for a while and get back to it with a new driver.
+                rate_limiter.release(throttled = True)
+                self._release(driver, healthy = False)
+
+                if not rate_limiter.retry(attempt):
+                    raise
+
+                logging.debug("webdriver : %s failed (%s), retrying" % (url, e))
+                continue
 
-        return index_html
+            rate_limiter.release()
+            self._release(driver)
+            if index_html or not rate_limiter.retry(attempt):
+                break
 
-    def quit():
-        return self.driver.quit()
+        if index_html:
+            return index_html
+
+        raise RuntimeError("webdriver : could not retrieve %s" % url)
+
+    def quit(self):
+        """ shutdown every driver of the pool """
+        with self.drivers_lock:
+            drivers, self.drivers = self.drivers, []
+
+        for driver in drivers:
+            try:
+                driver.quit()
+            except (WebDriverException, OSError, urllib.error.URLError):
+                pass
+
+        self.idle_drivers = queue.LifoQueue()
 
 
 class Configuration:
@@ -98,8 +202,16 @@ class Configuration:
     base_url = "%s/en-us/powershell/module" % domain
     default_url = "https://%s/?view=powershell-%%s" % (base_url)
     default_theme_uri = "_themes/docs.theme/master/en-us/_themes"
+
+    # windows server modules table of contents, shared by every powershell version
+    windows_toc_url = "https://%s/windowsserver2019-ps/toc.json?view=windowsserver2019-ps" % base_url
+
+    @staticmethod
+    def docs_toc_url_for(powershell_version : str):
+        """ powershell docs table of contents url of a powershell api version """
+        return "https://{0:s}/psdocs/toc.json?view=powershell-{1:s}".format(Configuration.base_url, powershell_version)
     
-    def __init__(self, args):
+    def __init__(self, args, posh_webdriver = None, shared_outputs = None, download_pool = None, async_client = None):
 
         
         # selected powershell api version
@@ -108,8 +220,16 @@ class Configuration:
         # The modules and cmdlets pages are "versionned" using additional params in the GET request
         self.powershell_version_param = "view=powershell-{0:s}".format(self.powershell_version)
 
+        # sharded build : (shard index, shard count), only the modules of this shard are built, see in_shard
+        self.shard = args.shard
+        self.shard_name = "shard-%d-of-%d" % self.shard if self.shard else None
+
         # build folder (must be cleaned afterwards)
         self.build_folder = os.path.join(os.getcwd(), "_build_{0:s}".format(self.powershell_version))
+        if self.shard:
+            self.build_folder = "%s_%s" % (self.build_folder, self.shard_name)
+        elif args.merge_shards:
+            self.build_folder = "%s_merged" % self.build_folder
 
         # output file
         self.output_filepath = os.path.realpath(args.output)
@@ -118,45 +238,964 @@ class Configuration:
         self.docs_index_url = Configuration.default_url % self.powershell_version
 
         # powershell docs table of contents url
-        self.docs_toc_url =  "https://{0:s}/psdocs/toc.json?{2:s}".format(
-            Configuration.base_url, 
-            self.powershell_version,
-            self.powershell_version_param
-        )
+        self.docs_toc_url = Configuration.docs_toc_url_for(self.powershell_version)
 
-        self.windows_toc_url = "https://{0:s}/windowsserver2019-ps/toc.json?view=windowsserver2019-ps".format(
-            Configuration.base_url
-        )
+        # html parser backend used by BeautifulSoup, lxml being much faster than the builtin one
+        self.html_parser = args.parser
+        try:
+            bs("", self.html_parser)
+        except FeatureNotFound:
+            logging.warning("html parser %s is not installed, falling back on html.parser" % self.html_parser)
+            self.html_parser = "html.parser"
+
+        # recorded fixtures : --record saves every response for later replays, --replay serves them offline
+        global fixture_recorder, replay_server
+        self.fixtures = None
+        self.replay_server = None
+        if args.replay:
+            self.fixtures = FixtureStore(os.path.realpath(args.replay))
+            self.replay_server = ReplayServer(self.fixtures, args.replay_scale)
+        elif args.record:
+            self.fixtures = FixtureStore(os.path.realpath(args.record))
+        fixture_recorder = self.fixtures if args.record and not args.replay else None
+        replay_server = self.replay_server
+
+        # selenium webdriver, either shared between several builds (and quit by its owner) or private
+        self.private_webdriver = None
+        if self.replay_server:
+            self.webdriver = ReplayWebDriver(self.fixtures)
+        elif posh_webdriver:
+            self.webdriver = posh_webdriver
+        else:
+            self.webdriver = self.private_webdriver = PoshWebDriver(args.phantom, args.jobs)
+        if fixture_recorder:
+            self.webdriver = RecordingWebDriver(self.webdriver, fixture_recorder)
 
-        # selenium webdriver
-        self.webdriver = PoshWebDriver(args.phantom)
+        # modules index start page source : "toc" (built from the content toc), "static" (plain download) or "browser"
+        self.index_page = args.index_page
 
         # selected module
         self.filter_modules = [module.lower() for module in args.modules]
 
+        # keep a copy of every intermediate build stage folder
+        self.keep_stages = args.keep_stages
+
+        # outputs shared with the other versions built in this process, see SharedOutputs
+        self.shared_outputs = shared_outputs
+
+        # resume an interrupted crawl, see CrawlJournal
+        self.resume = args.resume
+        self.crawl_journal = None
+
+        # streaming mode, see StreamingPipeline
+        self.stream = args.stream
+        self.page_sink = None
+
+        # html pages serialization : "pretty" (indented) or "minified"
+        self.html_output = args.html_output
+        self.collect_metrics = args.metrics is not None
+
+        # pages text indexed in a full-text search table, see SqliteIndexBuilder
+        self.full_text = args.full_text
+        if self.full_text and not sqlite_has_fts5():
+            logging.warning("sqlite is not compiled with FTS5, the pages text will not be indexed")
+            self.full_text = False
+
+        # docset archive gzip compression level (0-9), and random access offset index (see make_docset)
+        self.compression_level = args.compression_level
+        self.archive_index = args.archive_index
+
+        # concurrent page downloads and html rewriting processes
+        # the download pool is either shared between several builds (and shut down by its owner) or private
+        self.jobs = max(1, args.jobs)
+        self.private_download_pool = None
+        if download_pool:
+            self.download_pool = download_pool
+        else:
+            self.download_pool = self.private_download_pool = DownloadPool(args.jobs, args.max_host_connections)
+
+        # http backend : blocking requests session, or asyncio httpx client (shared or private, like the webdriver)
+        global http_client
+        self.http_client = self.private_http_client = None
+        if async_client:
+            self.http_client = async_client
+        elif args.http_backend == "httpx":
+            if httpx is None:
+                logging.warning("httpx is not installed, falling back on the requests http backend")
+            else:
+                self.http_client = self.private_http_client = AsyncHttpClient(self.download_pool.max_host_connections, http2 = not args.no_http2)
+        http_client = self.http_client
+
+        # persistent http cache, shared by every download
+        global http_cache
+        self.http_cache = None
+        if not args.no_cache and not self.replay_server:
+            self.http_cache = HttpCache(os.path.realpath(args.cache_dir), args.cache_max_size * 1024 * 1024)
+        http_cache = self.http_cache
+
+    def in_shard(self, module_name : str):
+        """ whether a module is built by this shard : modules are spread across shards by a hash of their name """
+        if not self.shard:
+            return True
+
+        shard_index, shard_count = self.shard
+        return zlib.crc32(module_name.lower().encode("utf8")) % shard_count == shard_index - 1
+
+    def shard_toc(self, content_toc : dict):
+        """ modules of a content toc built by this shard """
+        return {name : module for name, module in content_toc.items() if self.in_shard(name)}
+
+    def __getstate__(self):
+        """ drop the non-picklable members when sent to html rewriting worker processes """
+        state = self.__dict__.copy()
+        for member in ["webdriver", "private_webdriver", "shared_outputs", "crawl_journal", "download_pool", "private_download_pool", "http_client", "private_http_client", "http_cache", "page_sink", "fixtures", "replay_server"]:
+            state[member] = None
+        return state
+
+    def close(self):
+        """ wait for the download workers, and flush or release the build resources """
+        if self.private_download_pool:
+            self.private_download_pool.shutdown()
+        else:
+            self.download_pool.wait()
+
+        if self.private_http_client:
+            self.private_http_client.close()
+
+        if self.http_cache:
+            self.http_cache.prune()
+
+        if fixture_recorder is self.fixtures and self.fixtures:
+            self.fixtures.save()
+
+        if self.replay_server:
+            self.replay_server.shutdown()
+
+        if self.private_webdriver:
+            self.private_webdriver.quit()
+
+
+def write_file_atomic(filepath : str, content, mode : str = 'wb', **kwargs):
+    """ 
+    Write a file content in one go, by replacing it with a temporary file.
+    Files may be shared between workers or hardlinked between build stages, so they are never modified in place.
+    """
+    fd, tmp_filepath = tempfile.mkstemp(dir = os.path.dirname(filepath))
+    try:
+        with os.fdopen(fd, mode, **kwargs) as f:
+            if isinstance(content, (str, bytes)):
+                f.write(content)
+            else:
+                for chunk in content:
+                    f.write(chunk)
+    except:
+        os.remove(tmp_filepath)
+        raise
+
+    os.replace(tmp_filepath, filepath)
+
+
+class BuildMetrics:
+    """ 
+    Build instrumentation : stages wall and cpu times, downloads latency, size and retries,
+    html files parse and rewrite times and index database throughput. Exported as a json report.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stages = collections.OrderedDict()
+        self.current_stage = None
+        self.stage_prefix = ""
+        self.downloads = {}
+        self.rewrites = {}
+        self.index = {}
+        self.counters = collections.Counter()
+
+    def start_stage(self, name : str):
+        """ start timing a new build stage, and stop the current one """
+        self.stop_stage()
+        self.current_stage = (self.stage_prefix + name, time.perf_counter(), time.process_time())
+
+    def stop_stage(self):
+        if not self.current_stage:
+            return
+
+        name, wall_start, cpu_start = self.current_stage
+        self.stages[name] = {
+            'wall_time' : time.perf_counter() - wall_start,
+            'cpu_time' : time.process_time() - cpu_start, # main process only, not the rewrite workers
+        }
+        self.current_stage = None
+
+    def count(self, counter : str, value : int = 1):
+        with self.lock:
+            self.counters[counter] += value
+
+    def record_download(self, url : str, latency : float, size : int, status : int, retries : int = 0):
+        with self.lock:
+            download = self.downloads.setdefault(url, {'retries' : 0})
+            download.update({
+                'latency' : latency,
+                'bytes' : size,
+                'status' : status,
+            })
+            download['retries'] += retries
+
+    def record_retry(self, url : str):
+        with self.lock:
+            download = self.downloads.setdefault(url, {'retries' : 0})
+            download['retries'] += 1
+
+    def record_rewrite(self, path : str, timings : dict):
+        with self.lock:
+            self.rewrites[path] = timings
+
+    def record_index(self, **stats):
+        with self.lock:
+            self.index.update(stats)
+
+    def report(self):
+        """ metrics summary along with the raw measures """
+
+        def slowest(measures, key, count = 10):
+            return sorted(measures.items(), key = lambda m: m[1].get(key, 0), reverse = True)[:count]
+
+        latencies = sorted(d['latency'] for d in self.downloads.values() if 'latency' in d)
+        rewrite_times = [t['parse_time'] + t['rewrite_time'] + t['serialize_time'] for t in self.rewrites.values()]
+
+        # minified output compared to prettify, on the sampled pages
+        samples = [t for t in self.rewrites.values() if 'prettify_size' in t]
+        output = {
+            'bytes' : sum(t.get('output_size', 0) for t in self.rewrites.values()),
+            'serialize_time' : sum(t['serialize_time'] for t in self.rewrites.values()),
+        }
+        if samples:
+            output['prettify_samples'] = {
+                'count' : len(samples),
+                'bytes' : sum(t['output_size'] for t in samples),
+                'prettify_bytes' : sum(t['prettify_size'] for t in samples),
+                'serialize_time' : sum(t['serialize_time'] for t in samples),
+                'prettify_time' : sum(t['prettify_time'] for t in samples),
+            }
+
+        return {
+            'stages' : self.stages,
+            'downloads' : {
+                'count' : len(latencies),
+                'bytes' : sum(d.get('bytes', 0) for d in self.downloads.values()),
+                'retries' : sum(d['retries'] for d in self.downloads.values()),
+                'mean_latency' : sum(latencies) / len(latencies) if latencies else 0,
+                'p95_latency' : latencies[int(len(latencies) * 0.95)] if latencies else 0,
+                'slowest' : slowest(self.downloads, 'latency'),
+                'urls' : self.downloads,
+            },
+            'rewrites' : {
+                'count' : len(rewrite_times),
+                'total_time' : sum(rewrite_times),
+                'output' : output,
+                'slowest' : slowest(self.rewrites, 'parse_time'),
+                'files' : self.rewrites,
+            },
+            'index' : self.index,
+            'counters' : self.counters,
+        }
+
+    def save(self, filepath : str):
+        self.stop_stage()
+        write_file_atomic(filepath, json.dumps(self.report(), indent = 2), "w", encoding = "utf8")
+
+    def log_summary(self):
+        self.stop_stage()
+        for name, stage in self.stages.items():
+            logging.info("%s : %.1fs (cpu %.1fs)" % (name, stage['wall_time'], stage['cpu_time']))
+
+
+# Global build metrics, see BuildMetrics
+metrics = BuildMetrics()
+
 
 # Global session for several retries
+# urllib3 only retries connection errors, throttling responses (and their Retry-After) are handled by the RateLimiter
 session = requests.Session()
-retries = Retry(total=5, backoff_factor=1, status_forcelist=[ 502, 503, 504 ])
+retries = Retry(total=5, backoff_factor=1, status=0, respect_retry_after_header=False, raise_on_status=False)
 session.mount('http://', HTTPAdapter(max_retries=retries))
+session.mount('https://', HTTPAdapter(max_retries=retries))
 
 
-def download_binary(url, output_filename):
-    """ Download GET request as binary file """
-    global session
-    
-    logging.debug("download_binary : %s -> %s" % (url, output_filename))
+class RateLimiter:
+    """ 
+    Adaptive scheduler shared by every fetcher (downloads and webdriver) :
+        - a token bucket caps the requests rate
+        - the number of concurrent requests is halved on every throttling response (429, 5xx, connection errors),
+          and ramped back up one by one while the server answers normally
+        - every fetcher pauses until the server's Retry-After delay (or an exponential backoff) has elapsed
+        - retries are capped, per request and per build (see reset_retries)
+    """
+
+    throttle_status_codes = (429, 500, 502, 503, 504)
+
+    # consecutive successful requests before ramping up the concurrency and rate
+    ramp_up_successes = 20
+    min_rate = 0.5
+    max_backoff = 120
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.configure()
+
+    def configure(self, max_rate : float = 0, max_concurrency : int = 1, max_attempts : int = 5, max_retries : int = 200):
+        """ max_rate in requests per second (0 : unlimited), max_retries being the retries budget of a build """
+        with self.condition:
+            self.max_rate = max_rate or None
+            self.rate = self.max_rate
+            self.tokens = max(1, self.rate or 1)
+            self.last_refill = time.monotonic()
+
+            self.max_concurrency = max(1, max_concurrency)
+            self.concurrency = self.max_concurrency
+            self.in_flight = 0
+            self.successes = 0
+            self.failures = 0
+            self.resume_at = 0
+
+            self.max_attempts = max(1, max_attempts)
+            self.max_retries = max_retries
+            self.retries_left = max_retries
+
+            self.condition.notify_all()
+
+    def reset_retries(self):
+        """ refill the retries budget, at the start of every build (a --watch daemon would otherwise use it up for good) """
+        with self.condition:
+            self.retries_left = self.max_retries
+
+    def _refill(self, now : float):
+        if not self.rate:
+            return
+
+        self.tokens = min(max(1, self.rate), self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def acquire(self):
+        """ wait for a request slot """
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+
+                wait = None
+                if now < self.resume_at:
+                    wait = self.resume_at - now
+                elif self.in_flight >= self.concurrency:
+                    wait = 1
+                elif self.rate and self.tokens < 1:
+                    wait = (1 - self.tokens) / self.rate
+                else:
+                    break
+
+                self.condition.wait(wait)
+
+            if self.rate:
+                self.tokens -= 1
+            self.in_flight += 1
+
+    def release(self, throttled : bool = False, retry_after : float = None):
+        """ free a request slot, and adapt the rate and concurrency according to the request outcome """
+        with self.condition:
+            self.in_flight -= 1
+
+            if not throttled:
+                self.failures = 0
+                self.successes += 1
+                if self.successes >= self.ramp_up_successes:
+                    self.successes = 0
+                    self.concurrency = min(self.max_concurrency, self.concurrency + 1)
+                    if self.rate:
+                        self.rate = min(self.max_rate, self.rate * 1.25)
+
+            else:
+                self.successes = 0
+                self.failures += 1
+                self.concurrency = max(1, self.concurrency // 2)
+                if self.rate:
+                    self.rate = max(self.min_rate, self.rate / 2)
+
+                # every fetcher lays low, either as requested by the server or with an exponential backoff
+                delay = retry_after
+                if delay is None:
+                    delay = min(self.max_backoff, 2 ** (self.failures - 1))
+                self.resume_at = max(self.resume_at, time.monotonic() + min(self.max_backoff, delay))
+
+                logging.debug("rate limiter : throttled, %d concurrent requests, %s requests/s, pausing %.1fs" % (
+                    self.concurrency, "%.1f" % self.rate if self.rate else "unlimited", delay
+                ))
+
+            self.condition.notify_all()
+
+    def retry(self, attempt : int):
+        """ whether a failed request can be retried once more """
+        with self.condition:
+            if attempt + 1 >= self.max_attempts or self.retries_left <= 0:
+                return False
+
+            self.retries_left -= 1
+            return True
+
+
+def retry_after_delay(r : requests.Response):
+    """ Retry-After header value in seconds, if any """
+    retry_after = r.headers.get('Retry-After')
+    if not retry_after:
+        return None
+
+    try:
+        return max(0, float(retry_after))
+    except ValueError:
+        pass
+
+    try:
+        retry_date = email.utils.parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError):
+        return None
+    return max(0, retry_date.timestamp() - time.time())
+
+
+# Global requests scheduler, see RateLimiter
+rate_limiter = RateLimiter()
+
+
+class HttpCache:
+    """ 
+    On-disk http cache, used to revalidate previously downloaded pages using conditional GET requests.
+
+    Layout : 
+        entries/<sha256(url)>.json : url, ETag, Last-Modified, encoding and body hash
+        objects/<sha256(body)>     : response body, content addressed
+    """
+
+    def __init__(self, cache_dir : str, max_size : int):
+
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.entries_dir = os.path.join(cache_dir, "entries")
+        self.objects_dir = os.path.join(cache_dir, "objects")
+
+        for folder in [self.entries_dir, self.objects_dir]:
+            os.makedirs(folder, exist_ok=True)
+
+    def _entry_path(self, key : str):
+        return os.path.join(self.entries_dir, "%s.json" % hashlib.sha256(key.encode("utf8")).hexdigest())
+
+    def _object_path(self, digest : str):
+        return os.path.join(self.objects_dir, digest)
+
+    def _load_entry(self, key : str):
+        try:
+            with open(self._entry_path(key), 'r', encoding="utf8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        # the body may have been evicted in between
+        if not os.path.exists(self._object_path(entry['digest'])):
+            return None
+
+        return entry
+
+    def _store(self, key : str, r : requests.Response):
+        """ store a 200 response, only if it can be revalidated later on """
+
+        etag = r.headers.get('ETag')
+        last_modified = r.headers.get('Last-Modified')
+        if not etag and not last_modified:
+            return
+
+        digest = hashlib.sha256(r.content).hexdigest()
+        if not os.path.exists(self._object_path(digest)):
+            write_file_atomic(self._object_path(digest), r.content)
+
+        entry = {
+            'url' : r.url,
+            'etag' : etag,
+            'last_modified' : last_modified,
+            'encoding' : r.encoding,
+            'digest' : digest,
+            'size' : len(r.content),
+            'last_access' : time.time(),
+        }
+        write_file_atomic(self._entry_path(key), json.dumps(entry).encode("utf8"))
+
+    def _cached_response(self, key : str, entry : dict, r : requests.Response):
+        """ craft a 200 response from a 304 one and the cached body """
+
+        with open(self._object_path(entry['digest']), 'rb') as f:
+            content = f.read()
+
+        entry['last_access'] = time.time()
+        write_file_atomic(self._entry_path(key), json.dumps(entry).encode("utf8"))
+
+        cached = requests.Response()
+        cached.status_code = 200
+        cached.url = r.url
+        cached.headers = r.headers
+        cached.encoding = entry['encoding']
+        cached._content = content
+        cached._content_consumed = True
+        return cached
+
+    def get(self, session : requests.Session, url : str, **kwargs):
+        """ GET request revalidated against the cache content """
+
+        key = url
+        if kwargs.get('data'):
+            key = "%s#%s" % (url, json.dumps(kwargs['data'], sort_keys = True))
+
+        entry = self._load_entry(key)
+
+        headers = dict(kwargs.pop('headers', None) or {})
+        if entry and entry['etag']:
+            headers['If-None-Match'] = entry['etag']
+        if entry and entry['last_modified']:
+            headers['If-Modified-Since'] = entry['last_modified']
+
+        r = session.get(url, headers = headers, **kwargs)
+
+        if entry and r.status_code == 304:
+            logging.debug("http cache : %s not modified" % url)
+            metrics.count("http_cache_not_modified")
+            return self._cached_response(key, entry, r)
+
+        if r.status_code == 200:
+            self._store(key, r)
+
+        return r
+
+    def prune(self):
+        """ evict least recently used entries until the cache fits in max_size """
+
+        entries = []
+        for entry_filename in os.listdir(self.entries_dir):
+            entry_filepath = os.path.join(self.entries_dir, entry_filename)
+            try:
+                with open(entry_filepath, 'r', encoding="utf8") as f:
+                    entries.append((entry_filepath, json.load(f)))
+            except (OSError, ValueError):
+                os.remove(entry_filepath)
+
+        # most recently used first
+        entries.sort(key = lambda e: e[1]['last_access'], reverse = True)
+
+        kept_digests = set()
+        cache_size = 0
+        for entry_filepath, entry in entries:
+
+            if entry['digest'] in kept_digests:
+                continue
+
+            if cache_size + entry['size'] <= self.max_size:
+                kept_digests.add(entry['digest'])
+                cache_size += entry['size']
+            else:
+                logging.debug("http cache : evicting %s" % entry['url'])
+                os.remove(entry_filepath)
+
+        for digest in os.listdir(self.objects_dir):
+            if digest not in kept_digests:
+                os.remove(self._object_path(digest))
+
+
+# Optional on-disk http cache, see HttpCache
+http_cache = None
+
+class AsyncHttpClient:
+    """ 
+    Session-like http client backed by httpx on an asyncio event loop running in its own thread :
+    a single keep-alive connection pool shared by every download worker, multiplexing the requests
+    over HTTP/2 connections when the h2 package is installed.
+    get() blocks the calling worker until the response is fully received, and returns a requests.Response
+    so that it can stand in for the requests session (http cache, rate limiter, metrics, ...).
+    """
+
+    def __init__(self, max_connections : int = 10, http2 : bool = True):
+
+        self.http2 = http2 and importlib.util.find_spec("h2") is not None
+        if http2 and not self.http2:
+            logging.warning("h2 is not installed, falling back on HTTP/1.1 keep-alive connections")
+
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target = self.loop.run_forever, daemon = True)
+        self.thread.start()
+
+        async def create_client():
+            return httpx.AsyncClient(
+                http2 = self.http2,
+                limits = httpx.Limits(max_connections = max_connections, max_keepalive_connections = max_connections),
+                timeout = httpx.Timeout(30, connect = 10),
+                follow_redirects = True,
+            )
+        self.client = self._run(create_client())
+
+    def _run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    async def _get(self, url : str, headers : dict, data):
+        try:
+            response = await self.client.request("GET", url, headers = headers, data = data)
+        except httpx.TransportError as e:
+            raise ConnectionError(e)
+
+        r = requests.Response()
+        r.status_code = response.status_code
+        r.url = str(response.url)
+        r.headers = requests.structures.CaseInsensitiveDict(response.headers)
+        r.encoding = requests.utils.get_encoding_from_headers(r.headers)
+        r.reason = response.reason_phrase
+        r._content = response.content
+        r._content_consumed = True
+        return r
+
+    def get(self, url : str, headers : dict = None, data = None, **kwargs):
+        """ requests.Session.get equivalent, responses are always fully read """
+        return self._run(self._get(url, headers, data))
+
+    def close(self):
+        self._run(self.client.aclose())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+
+# Optional asyncio http client used instead of the requests session, see AsyncHttpClient
+http_client = None
 
-    # ensure the folder path actually exist
-    os.makedirs(os.path.dirname(output_filename), exist_ok = True)
 
-    r = session.get(url, stream=True)
-    with open(output_filename, 'wb') as f:
-        for data in r.iter_content(32*1024):
-            f.write(data)
+def http_get(url : str, **kwargs):
+    """ GET request using the global session (or http client), revalidated against the http cache if enabled """
+    global session, http_client, http_cache, metrics, fixture_recorder, replay_server, rate_limiter
+
+    client = http_client or session
+
+    # replay mode : recorded responses are served by a local server
+    request_url = url
+    if replay_server:
+        request_url = replay_server.local_url(url)
+
+    start = time.perf_counter()
+    for attempt in itertools.count():
+
+        rate_limiter.acquire()
+        try:
+            if http_cache is None:
+                r = client.get(request_url, **kwargs)
+            else:
+                r = http_cache.get(client, request_url, **kwargs)
+        except (ConnectionError, RetryError) as e:
+            rate_limiter.release(throttled = True)
+            if not rate_limiter.retry(attempt):
+                raise
+
+            logging.debug("caught %s on %s, retrying..." % (type(e).__name__, url))
+            metrics.record_retry(url)
+            continue
+
+        throttled = r.status_code in RateLimiter.throttle_status_codes
+        rate_limiter.release(throttled, retry_after_delay(r) if throttled else None)
+
+        if not throttled or not rate_limiter.retry(attempt):
+            break
+
+        logging.debug("%s answered %d, retrying..." % (url, r.status_code))
+        metrics.record_retry(url)
+        metrics.count("throttled")
+        r.close()
+
+    if fixture_recorder:
+        fixture_recorder.record_response(url, r)
+
+    retries = getattr(getattr(r.raw, 'retries', None), 'history', ())
+    metrics.record_download(url, time.perf_counter() - start, len(r.content), r.status_code, len(retries))
+
+    return r
+
+
+class DownloadPool:
+    """ Bounded worker pool for concurrent page downloads, with a per-host connections cap """
+
+    def __init__(self, jobs : int = 1, max_host_connections : int = None):
+
+        self.jobs = max(1, jobs)
+        self.max_host_connections = max(1, max_host_connections or self.jobs)
+
+        # jobs == 1 : download synchronously, like before
+        self.executor = None
+        if self.jobs > 1:
+            self.executor = concurrent.futures.ThreadPoolExecutor(max_workers = self.jobs)
+
+        self._pending = []
+        self._hosts = {}
+        self._hosts_lock = threading.Lock()
+
+        # the default connection pool of requests is too small for our workers
+        global session, retries
+        session.mount('https://', HTTPAdapter(pool_maxsize = self.jobs, max_retries = retries))
+
+    def _host_semaphore(self, url : str):
+        """ return the semaphore capping the number of concurrent connections to url's host """
+        host = urllib.parse.urlparse(url).netloc
+
+        with self._hosts_lock:
+            if host not in self._hosts:
+                self._hosts[host] = threading.BoundedSemaphore(self.max_host_connections)
+            return self._hosts[host]
+
+    def _run(self, url : str, func, *args, callback = None):
+        with self._host_semaphore(url):
+            result = func(url, *args)
+
+        # the host connection is released before running the callback
+        if callback:
+            callback()
+
+        return result
+
+    def submit(self, func, url : str, *args, callback = None):
+        """ 
+        schedule func(url, *args), followed by callback() on the same worker.
+        Executed immediately if no workers are available 
+        """
+
+        if not self.executor:
+            return self._run(url, func, *args, callback = callback)
+
+        future = self.executor.submit(self._run, url, func, *args, callback = callback)
+        self._pending.append(future)
+        return future
+
+    def join(self):
+        """ wait for every scheduled download, and raise the first error encountered """
+        pending, self._pending = self._pending, []
+
+        for future in concurrent.futures.as_completed(pending):
+            future.result()
+
+    def wait(self):
+        """ wait for every scheduled download, ignoring their errors (e.g. after a failed build) """
+        pending, self._pending = self._pending, []
+        concurrent.futures.wait(pending)
+
+    def queue_depth(self):
+        """ number of scheduled downloads not completed yet """
+        return sum(1 for future in list(self._pending) if not future.done())
+
+    def shutdown(self):
+        if self.executor:
+            self.executor.shutdown(wait = True)
+
+
+class FixtureStore:
+    """ 
+    Recorded http responses and rendered pages, used to replay a whole build offline.
+
+    Layout : 
+        fixtures.json     : { 'responses' : { url : {status, content_type, digest} }, 'pages' : { url : digest } }
+        objects/<sha256>  : responses bodies, content addressed
+    """
+
+    def __init__(self, fixtures_dir : str):
+
+        self.fixtures_dir = fixtures_dir
+        self.objects_dir = os.path.join(fixtures_dir, "objects")
+        self.index_filepath = os.path.join(fixtures_dir, "fixtures.json")
+        self.lock = threading.Lock()
+
+        self.responses = {}
+        self.pages = {}
+        if os.path.exists(self.index_filepath):
+            with open(self.index_filepath, 'r', encoding="utf8") as f:
+                fixtures = json.load(f)
+            self.responses = fixtures['responses']
+            self.pages = fixtures['pages']
+
+    def _store_object(self, content : bytes):
+        digest = hashlib.sha256(content).hexdigest()
+        object_path = os.path.join(self.objects_dir, digest)
+        if not os.path.exists(object_path):
+            os.makedirs(self.objects_dir, exist_ok = True)
+            write_file_atomic(object_path, content)
+        return digest
+
+    def _load_object(self, digest : str):
+        with open(os.path.join(self.objects_dir, digest), 'rb') as f:
+            return f.read()
+
+    def record_response(self, url : str, r : requests.Response):
+        digest = self._store_object(r.content)
+        with self.lock:
+            self.responses[url] = {
+                'status' : r.status_code,
+                'content_type' : r.headers.get('Content-Type'),
+                'digest' : digest,
+            }
+
+    def record_page(self, url : str, html : str):
+        digest = self._store_object(html.encode("utf8"))
+        with self.lock:
+            self.pages[url] = digest
+
+    def response(self, url : str):
+        """ (status, content type, body) recorded for url, or None """
+        fixture = self.responses.get(url)
+        if not fixture:
+            return None
+        return fixture['status'], fixture['content_type'], self._load_object(fixture['digest'])
+
+    def page(self, url : str):
+        digest = self.pages.get(url)
+        if not digest:
+            raise KeyError("no recorded page for %s" % url)
+        return self._load_object(digest).decode("utf8")
+
+    def save(self):
+        with self.lock:
+            fixtures = json.dumps({'responses' : self.responses, 'pages' : self.pages}, indent = 2, sort_keys = True)
+        write_file_atomic(self.index_filepath, fixtures, "w", encoding = "utf8")
+
+
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    """ http.server.ThreadingHTTPServer, which is only available from python 3.7 """
+    daemon_threads = True
+
+
+class ReplayServer:
+    """ 
+    Local stand-in http server for the docs website, serving recorded fixtures.
+
+    The recorded url https://<host>/<path>?<query> is served at http://127.0.0.1:<port>/https/<host>/<path>?<query>.
+    With scale > 1, the tables of contents are replicated to build a larger synthetic corpus :
+    copies of a module are renamed "<module>_<n>" and their pages are served through a "_copy_<n>" path segment.
+    """
+
+    copy_segment = re.compile(r"/_copy_\d+(?=/)")
+    special_toc_titles = ("about", "functions", "providers", "provider")
+
+    def __init__(self, store : FixtureStore, scale : int = 1):
+
+        self.store = store
+        self.scale = max(1, scale)
+
+        replay_server = self
+        class ReplayRequestHandler(http.server.BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                response = replay_server.response(self.path)
+                if not response:
+                    self.send_error(404)
+                    return
+
+                status, content_type, body = response
+                self.send_response(status)
+                if content_type:
+                    self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logging.debug("replay server : %s" % (format % args))
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), ReplayRequestHandler)
+        self.base_url = "http://127.0.0.1:%d" % self.server.server_address[1]
+        self.thread = threading.Thread(target = self.server.serve_forever, daemon = True)
+        self.thread.start()
+
+    def local_url(self, url : str):
+        """ local url serving the recorded url """
+        scheme, _, location = url.partition("://")
+        return "%s/%s/%s" % (self.base_url, scheme, location)
+
+    def _scale_toc_node(self, node : dict, copy : int):
+        copy_node = dict(node)
+
+        title = node.get('toc_title', '')
+        if title.lower() not in ReplayServer.special_toc_titles:
+            copy_node['toc_title'] = "%s_%d" % (title, copy)
+
+        href = node.get('href')
+        if href and not urllib.parse.urlparse(href).netloc:
+            if href.startswith("/"):
+                copy_node['href'] = "/_copy_%d%s" % (copy, href)
+            else:
+                copy_node['href'] = "_copy_%d/%s" % (copy, href)
+
+        if 'children' in node:
+            copy_node['children'] = [self._scale_toc_node(child, copy) for child in node['children']]
+
+        return copy_node
+
+    def _scale_toc(self, body : bytes):
+        toc = json.loads(body.decode("utf8"))
+        modules = toc['items'][0]['children']
+        for copy in range(2, self.scale + 1):
+            toc['items'][0]['children'] = toc['items'][0]['children'] + [self._scale_toc_node(m, copy) for m in modules]
+        return json.dumps(toc).encode("utf8")
+
+    def response(self, local_path : str):
+        """ (status, content type, body) to serve for a local path """
+        scheme, _, path = local_path.lstrip("/").partition("/")
+        url = "%s://%s" % (scheme, ReplayServer.copy_segment.sub("", "/" + path).lstrip("/"))
+
+        response = self.store.response(url)
+        if not response:
+            logging.warning("replay server : no recorded response for %s" % url)
+            return None
+
+        status, content_type, body = response
+        if self.scale > 1 and status == 200 and urllib.parse.urlparse(url).path.endswith("/toc.json"):
+            body = self._scale_toc(body)
+
+        return status, content_type, body
+
+    def shutdown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class RecordingWebDriver:
+    """ Webdriver wrapper recording the rendered pages in a FixtureStore """
+
+    def __init__(self, driver, store : FixtureStore):
+        self.driver = driver
+        self.store = store
+
+    def get_url_page(self, url):
+        index_html = self.driver.get_url_page(url)
+        self.store.record_page(url, index_html)
+        return index_html
+
+    def quit(self):
+        return self.driver.quit()
+
+
+class ReplayWebDriver:
+    """ Stand-in for PoshWebDriver, returning the rendered pages recorded in a FixtureStore """
+
+    def __init__(self, store : FixtureStore):
+        self.store = store
+
+    def get_url_page(self, url):
+        return self.store.page(url)
+
+    def quit(self):
+        pass
+
+
+# Optional fixtures recording and replay, see FixtureStore and ReplayServer
+fixture_recorder = None
+replay_server = None
+
 
 def download_textfile(url : str ,  output_filename : str, params : dict = None):
-    """ Download GET request as utf-8 text file """
+    """ Download GET request as utf-8 text file, raise requests.HTTPError on error responses (the file is left untouched) """
     global session
 
     logging.debug("download_textfile : %s -> %s" % (url, output_filename))
@@ -164,67 +1203,446 @@ def download_textfile(url : str ,  output_filename : str, params : dict = None):
     # ensure the folder path actually exist
     os.makedirs(os.path.dirname(output_filename), exist_ok = True)
     
-    while True:
-        try:
-            r = session.get(url, data = params)
-        except ConnectionError:
-            logging.debug("caught ConnectionError, retrying...")
-            time.sleep(2)
-        else:
-            break
+    # connection errors and throttling responses are retried by http_get, up to the rate limiter caps
+    r = http_get(url, data = params)
+    r.raise_for_status()
     
-    with open(output_filename, 'w', encoding="utf8") as f:
-        f.write(r.text)
+    write_file_atomic(output_filename, r.text, 'w', encoding="utf8")
+    return r
 
 
-def make_docset(source_dir, dst_filepath, filename):
+class ParallelGzipWriter:
     """ 
-    Tar-gz the build directory while conserving the relative folder tree paths. 
-    Copied from : https://stackoverflow.com/a/17081026/1741450 
+    Write-only gzip file object compressing fixed size blocks on a thread pool (zlib releases the GIL), pigz style :
+    a single gzip member made of raw deflate blocks ended by sync flushes, each block primed with the last 32KB
+    of the previous one. The gzip header carries no file name and a fixed mtime, for reproducible archives.
+    Independent blocks are not primed, so that inflating can start at any block (see DocsetArchiveReader) :
+    their (uncompressed, compressed) offsets are listed in blocks.
     """
-    dst_dir = os.path.dirname(dst_filepath)
-    tar_filepath = os.path.join(dst_dir, '%s.tar' % filename)
-    
-    with tarfile.open(tar_filepath, "w:gz") as tar:
-        tar.add(source_dir, arcname=os.path.basename(source_dir))
 
-    shutil.move(tar_filepath, dst_filepath)
-    
+    block_size = 1024 * 1024
+    dictionary_size = 32 * 1024
+
+    def __init__(self, fileobj, compresslevel : int = 9, jobs : int = 1, mtime : int = 0, independent_blocks : bool = False, block_size : int = None):
+
+        self.fileobj = fileobj
+        self.compresslevel = compresslevel
+        self.jobs = max(1, jobs)
+        self.independent_blocks = independent_blocks
+        if block_size:
+            self.block_size = block_size
+
+        self.executor = None
+        if self.jobs > 1:
+            self.executor = concurrent.futures.ThreadPoolExecutor(max_workers = self.jobs)
+
+        # compressed blocks along with their uncompressed offset, written back in order
+        self.pending = collections.deque()
+        self.buffer = bytearray()
+        self.dictionary = b""
+        self.crc = 0
+        self.size = 0
+        self.blocks = []
+
+        # gzip header : deflate, no flags, mtime, max compression hint, unknown OS
+        xfl = 2 if compresslevel == 9 else (4 if compresslevel == 1 else 0)
+        header = b"\x1f\x8b\x08\x00" + struct.pack("<I", mtime) + bytes([xfl, 255])
+        self.fileobj.write(header)
+        self.compressed_size = len(header)
+
+    def _compress(self, block : bytes, dictionary : bytes, last : bool):
+        if dictionary:
+            compressor = zlib.compressobj(self.compresslevel, zlib.DEFLATED, -zlib.MAX_WBITS, zdict = dictionary)
+        else:
+            compressor = zlib.compressobj(self.compresslevel, zlib.DEFLATED, -zlib.MAX_WBITS)
+
+        return compressor.compress(block) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+    def _write_block(self, offset : int, compressed : bytes):
+        self.blocks.append((offset, self.compressed_size))
+        self.fileobj.write(compressed)
+        self.compressed_size += len(compressed)
+
+    def _submit(self, block : bytes, last : bool = False):
+        offset = self.size
+        self.crc = zlib.crc32(block, self.crc)
+        self.size += len(block)
+
+        dictionary, self.dictionary = self.dictionary, block[-self.dictionary_size:]
+        if self.independent_blocks:
+            dictionary = b""
+
+        if self.executor:
+            self.pending.append((offset, self.executor.submit(self._compress, block, dictionary, last)))
+        else:
+            self._write_block(offset, self._compress(block, dictionary, last))
+
+        # bounded number of blocks in flight
+        while len(self.pending) > self.jobs * 2:
+            offset, compressed = self.pending.popleft()
+            self._write_block(offset, compressed.result())
+
+    def write(self, data):
+        self.buffer += data
+        while len(self.buffer) >= self.block_size:
+            self._submit(bytes(self.buffer[:self.block_size]))
+            del self.buffer[:self.block_size]
+        return len(data)
 
+    def close(self):
+        self._submit(bytes(self.buffer), last = True)
+        self.buffer = bytearray()
 
-def download_page_contents(configuration, uri, output_filepath):
+        while self.pending:
+            offset, compressed = self.pending.popleft()
+            self._write_block(offset, compressed.result())
+
+        if self.executor:
+            self.executor.shutdown()
+
+        self.fileobj.write(struct.pack("<II", self.crc & 0xffffffff, self.size & 0xffffffff))
+
+
+def make_docset(source_dir, dst_filepath, compresslevel : int = 9, jobs : int = 1, index_filepath : str = None):
+    """ 
+    Tar-gz the build directory while conserving the relative folder tree paths. The archive is written next
+    to dst_filepath and swapped in once complete, so a previous archive stays readable during the build.
+    Entries are sorted and their metadata (mtime, owner, permissions) normalized, so that identical
+    docset folders produce byte-identical archives. mtimes are set to $SOURCE_DATE_EPOCH if defined.
+    If index_filepath is given, the archive is compressed in independent blocks and their offsets, along with
+    the members ones, are written to this tarix-style index (see write_archive_index).
+    """
+    mtime = int(os.environ.get("SOURCE_DATE_EPOCH", 0))
+    members = {}
+
+    def normalize(tarinfo):
+        tarinfo.mtime = mtime
+        tarinfo.uid = tarinfo.gid = 0
+        tarinfo.uname = tarinfo.gname = ""
+        tarinfo.mode = 0o755 if tarinfo.isdir() else 0o644
+        members[tarinfo.name] = tarinfo
+        return tarinfo
+
+    # member name -> (uncompressed data offset, size)
+    data_offsets = {}
+
+    arc_root = os.path.basename(source_dir)
+    tmp_filepath = "%s.tmp" % dst_filepath
+    try:
+        with open(tmp_filepath, "wb") as f:
+            gz = ParallelGzipWriter(f, compresslevel, jobs, mtime, 
+                independent_blocks = bool(index_filepath), 
+                block_size = archive_index_block_size if index_filepath else None
+            )
+            with tarfile.open(fileobj = gz, mode = "w|", format = tarfile.PAX_FORMAT) as tar:
+                tar.add(source_dir, arcname = arc_root, recursive = False, filter = normalize)
+
+                for root, dirs, files in os.walk(source_dir):
+                    dirs.sort()
+                    for name in dirs + sorted(files):
+                        path = os.path.join(root, name)
+                        arcname = "/".join([arc_root] + os.path.relpath(path, source_dir).split(os.sep))
+                        tar.add(path, arcname = arcname, recursive = False, filter = normalize)
+
+                        # the member data ends the (512 bytes padded) tar entry, hardlinks share their target data
+                        # (tarinfo.offset_data is only set when reading archives)
+                        tarinfo = members.pop(arcname, None)
+                        if tarinfo and tarinfo.isreg():
+                            data_blocks = (tarinfo.size + tarfile.BLOCKSIZE - 1) // tarfile.BLOCKSIZE
+                            data_offsets[arcname] = (tar.offset - data_blocks * tarfile.BLOCKSIZE, tarinfo.size)
+                        elif tarinfo and tarinfo.islnk() and tarinfo.linkname in data_offsets:
+                            data_offsets[arcname] = data_offsets[tarinfo.linkname]
+            gz.close()
+    except:
+        # no truncated archive left behind
+        if os.path.exists(tmp_filepath):
+            os.remove(tmp_filepath)
+        raise
+
+    os.replace(tmp_filepath, dst_filepath)
+    if index_filepath:
+        write_archive_index(index_filepath, dst_filepath, gz.blocks, data_offsets)
+
+
+# uncompressed size of the independent blocks of indexed archives : the most data inflated to read a member
+archive_index_block_size = 256 * 1024
+
+def write_archive_index(index_filepath : str, archive_filepath : str, blocks : list, data_offsets : dict):
+    """ 
+    Write the tarix-style offset index of an archive : a sqlite database listing the compressed offsets of 
+    its independent blocks, and for every member its block, offset within this block and size.
+    """
+    block_offsets = [offset for offset, _ in blocks]
+
+    tmp_filepath = "%s.tmp" % index_filepath
+    if os.path.exists(tmp_filepath):
+        os.remove(tmp_filepath)
+
+    db = sqlite3.connect(tmp_filepath)
+    try:
+        db.execute('CREATE TABLE metadata(key TEXT PRIMARY KEY, value TEXT);')
+        db.execute('CREATE TABLE blocks(id INTEGER PRIMARY KEY, offset INTEGER, compressed_offset INTEGER);')
+        db.execute('CREATE TABLE members(path TEXT PRIMARY KEY, block INTEGER, offset INTEGER, size INTEGER);')
+
+        db.executemany('INSERT INTO metadata(key, value) VALUES (?,?)', [
+            ('archive', os.path.basename(archive_filepath)),
+            ('archive_size', str(os.path.getsize(archive_filepath))),
+            ('block_size', str(archive_index_block_size)),
+        ])
+        db.executemany('INSERT INTO blocks(id, offset, compressed_offset) VALUES (?,?,?)', 
+            ((block, offset, compressed_offset) for block, (offset, compressed_offset) in enumerate(blocks))
+        )
+
+        members = []
+        for path, (offset, size) in sorted(data_offsets.items()):
+            block = bisect.bisect_right(block_offsets, offset) - 1
+            members.append((path, block, offset - block_offsets[block], size))
+        db.executemany('INSERT INTO members(path, block, offset, size) VALUES (?,?,?,?)', members)
+
+        db.commit()
+    finally:
+        db.close()
+
+    os.replace(tmp_filepath, index_filepath)
+
+def archive_index_filepath(archive_filepath : str):
+    """ tarix-style index written next to an archive, see write_archive_index """
+    return "%s.tarix" % archive_filepath
+
+class DocsetArchiveReader:
+    """ 
+    Random access to the members of a docset archive packaged with an offset index (see make_docset) : 
+    a member is read by inflating its archive from the start of the block holding it, instead of the whole stream.
+    """
+
+    def __init__(self, archive_filepath : str, index_filepath : str = None):
+
+        self.archive = open(archive_filepath, 'rb')
+        self.db = sqlite3.connect(index_filepath or archive_index_filepath(archive_filepath))
+
+        metadata = dict(self.db.execute('SELECT key, value FROM metadata'))
+        if int(metadata['archive_size']) != os.path.getsize(archive_filepath):
+            self.close()
+            raise ValueError("the index of %s does not match the archive" % archive_filepath)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def members(self):
+        """ paths of the archive files """
+        return [path for path, in self.db.execute('SELECT path FROM members ORDER BY path')]
+
+    def read(self, path : str):
+        """ content of an archive file """
+        row = self.db.execute(
+            'SELECT members.offset, members.size, blocks.compressed_offset FROM members '
+            'JOIN blocks ON blocks.id = members.block WHERE members.path = ?', 
+            (path,)
+        ).fetchone()
+        if not row:
+            raise KeyError(path)
+
+        offset, size, compressed_offset = row
+        self.archive.seek(compressed_offset)
+
+        # members may span several blocks : the deflate stream simply goes on
+        inflater = zlib.decompressobj(-zlib.MAX_WBITS)
+        data = bytearray()
+        while len(data) < offset + size:
+            compressed = inflater.unconsumed_tail or self.archive.read(64 * 1024)
+            if not compressed:
+                raise ValueError("%s is truncated" % self.archive.name)
+            data += inflater.decompress(compressed, offset + size - len(data))
+
+        return bytes(data[offset:])
+
+    def close(self):
+        self.archive.close()
+        self.db.close()
+
+def archive_latency(archive_filepath : str, samples : int = 20):
+    """ 
+    time random-access reads of sampled members of an indexed archive against a full extraction (in memory),
+    and check they read the same contents
+    """
+    with DocsetArchiveReader(archive_filepath) as reader:
+        members = reader.members()
+        sampled = random.Random(0).sample(members, min(samples, len(members)))
+
+        read_times = []
+        contents = {}
+        for path in sampled:
+            start = time.perf_counter()
+            contents[path] = reader.read(path)
+            read_times.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    extracted = {}
+    with tarfile.open(archive_filepath, "r:gz") as tar:
+        for member in tar:
+            # deduplicated resources are stored as hardlinks, which extractfile follows
+            if member.isfile() or member.islnk():
+                extracted[member.name] = tar.extractfile(member).read()
+    extraction_time = time.perf_counter() - start
+
+    mismatches = [path for path in sampled if contents[path] != extracted.get(path)]
+    if mismatches:
+        raise ValueError("indexed reads differ from the archive contents : %s" % mismatches)
+
+    return {
+        'members' : len(members),
+        'samples' : len(sampled),
+        'mean_read_time' : sum(read_times) / len(read_times) if read_times else 0,
+        'max_read_time' : max(read_times, default = 0),
+        'extraction_time' : extraction_time,
+    }
+
+
+class CrawlJournal:
+    """ 
+    Append-only checkpoint journal of the completed page downloads, one json record per line : 
+    {url, path, digest}. With resume, pages already recorded (and left untouched since) are not downloaded again,
+    otherwise the journal is started afresh.
+    """
+
+    def __init__(self, filepath : str, resume : bool = False):
+
+        self.filepath = filepath
+        self.lock = threading.Lock()
+        self.completed = {}
+
+        if resume and os.path.exists(filepath):
+            records = []
+            with open(filepath, 'r', encoding="utf8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break # truncated by a crash, the following records can't be trusted
+
+                    records.append(line)
+                    self.completed[(record['url'], record['path'])] = record['digest']
+
+            # drop the truncated record before appending new ones
+            write_file_atomic(filepath, "".join(records), "w", encoding="utf8")
+            logging.info("resuming crawl : %d pages already downloaded" % len(self.completed))
+
+        self.journal = open(filepath, 'a' if resume else 'w', encoding="utf8")
+
+    def is_completed(self, url : str, filepath : str):
+        digest = self.completed.get((url, filepath))
+        return digest is not None and digest == file_digest(filepath)
+
+    def record(self, url : str, filepath : str):
+        record = json.dumps({'url' : url, 'path' : filepath, 'digest' : file_digest(filepath)})
+        with self.lock:
+            self.journal.write(record + "\n")
+            self.journal.flush()
+
+    def close(self):
+        with self.lock:
+            self.journal.close()
+
+
+def download_page_contents(configuration, uri, output_filepath, on_downloaded = None):
     """ Download a page using it's uri from the TOC """
 
     # Resolving "absolute" url et use appropriate version
     full_url = urllib.parse.urljoin(configuration.docs_toc_url, uri)
     versionned_url = "{0:s}?{1:s}".format(full_url, configuration.powershell_version_param) 
 
-    download_textfile(versionned_url, output_filepath)
+    # already downloaded by an interrupted crawl
+    crawl_journal = configuration.crawl_journal
+    if crawl_journal and crawl_journal.is_completed(versionned_url, output_filepath):
+        logging.debug("download_textfile : %s -> %s (resumed)" % (versionned_url, output_filepath))
+        metrics.count("resumed_pages")
+        if on_downloaded:
+            on_downloaded()
+        return
+
+    def download_page(url, filepath):
+        try:
+            download_textfile(url, filepath)
+        except requests.HTTPError as e:
+            # failed page : the previously downloaded one (if any) is kept, and not recorded as completed
+            logging.error("cannot download %s : %s" % (url, e))
+            metrics.count("failed_pages")
+            return
+
+        if crawl_journal:
+            crawl_journal.record(url, filepath)
+
+    # scheduled on the download pool, call configuration.download_pool.join() to wait for completion
+    configuration.download_pool.submit(download_page, versionned_url, output_filepath, callback = on_downloaded)
     
 
-def download_module_contents(configuration, module_name, module_uri, module_dir, cmdlets, root_dir):
-    """ Download a modules contents """
+def download_module_contents(configuration, module_name, module_uri, module_dir, cmdlets, root_dir, download : bool = True):
+    """ Download a modules contents, or only return its content toc entry if download is False (see --shard) """
     
     module_filepath = os.path.join(module_dir, "%s.html" % module_name)
 
+    # streaming mode : pages are handed over to the pipeline as soon as they are downloaded
+    page_sink = configuration.page_sink
+
+    def download_page(uri, filepath, on_downloaded):
+        if download:
+            download_page_contents(configuration, uri, filepath, on_downloaded)
+
+    def schedule_page(filepath, record_name, record_type):
+        if not page_sink or not download:
+            return None
+
+        # cmdlets named like their module are only indexed as a module
+        index_record = (record_name, record_type, os.path.relpath(filepath, root_dir))
+        if record_type == "Command" and record_name == module_name:
+            index_record = None
+
+        return page_sink.schedule(filepath, root_dir, index_record)
+
     logging.debug("downloading %s module index page  -> %s" % (module_name, module_filepath))
+    on_downloaded = schedule_page(module_filepath, module_name, "Module")
     if module_uri:
-        download_page_contents(configuration, module_uri, module_filepath)
+        download_page(module_uri, module_filepath, on_downloaded)
+    elif on_downloaded:
+        on_downloaded()
 
     cmdlets_infos = []
+    about_infos = []
 
     # Downloading cmdlet contents
     for cmdlet in cmdlets:
 
         cmdlet_name = cmdlet['toc_title']
-        if cmdlet_name.lower() in ("about", "functions", "providers", "provider"): # skip special toc
+
+        # about_ topics are stored in an "about" subfolder, like online
+        if cmdlet_name.lower() == "about":
+            for topic in cmdlet.get('children', []):
+                if not topic.get("href"):
+                    continue
+
+                topic_name = topic['toc_title']
+                topic_filepath = os.path.join(module_dir, "about", "%s.html" % topic_name)
+
+                logging.debug("downloading %s about topic -> %s" % (topic_name, topic_filepath))
+                download_page(topic["href"], topic_filepath, schedule_page(topic_filepath, topic_name, "Guide"))
+
+                about_infos.append({
+                    'name' : topic_name,
+                    'path' : os.path.relpath(topic_filepath, root_dir),
+                })
+            continue
+
+        if cmdlet_name.lower() in ("functions", "providers", "provider"): # skip special toc
             continue
 
         cmdlet_uri = cmdlet["href"]
         cmdlet_filepath = os.path.join(module_dir, "%s.html" % cmdlet_name)
 
         logging.debug("downloading %s cmdlet doc -> %s" % (cmdlet_name, cmdlet_filepath))
-        download_page_contents(configuration, cmdlet_uri, cmdlet_filepath)
+        download_page(cmdlet_uri, cmdlet_filepath, schedule_page(cmdlet_filepath, cmdlet_name, "Command"))
 
         cmdlets_infos.append({
             'name' : cmdlet_name,
@@ -234,22 +1652,20 @@ def download_module_contents(configuration, module_name, module_uri, module_dir,
     module_infos = {
         'name' : module_name,
         'index' : os.path.relpath(module_filepath, root_dir),
-        'cmdlets' : cmdlets_infos
+        'cmdlets' : cmdlets_infos,
+        'about' : about_infos,
     }
 
     return module_infos
 
-def crawl_posh_contents(configuration: Configuration, toc_url : str, download_dir : str, ):
-    """ Download Powershell modules and cmdlets content pages based on TOC """
+def download_modules_toc(configuration: Configuration, toc_url : str):
+    """ Download a web based modules TOC, and return its (selected) modules entries """
 
-    # Download toc
     logging.debug("Downloading powershell toc : %s" % (toc_url))
-    r = requests.get(toc_url)
+    r = http_get(toc_url)
+    r.raise_for_status()
     modules_toc = json.loads(r.text)
 
-    # modules_toc is a web based TOC, where as content_toc is file based
-    content_toc = {}
-
     logging.debug("raw modules : %s" % [m['toc_title'] for m in modules_toc['items'][0]['children']])
 
     # optional filter on selected module
@@ -258,6 +1674,19 @@ def crawl_posh_contents(configuration: Configuration, toc_url : str, download_di
         modules = list(filter(lambda m: m['toc_title'].lower() in configuration.filter_modules, modules))
         logging.debug("filtered modules : %s" % [m['toc_title'] for m in modules])
 
+    return modules
+
+def crawl_posh_contents(configuration: Configuration, modules : list, download_dir : str, download : bool = True):
+    """ 
+    Download Powershell modules and cmdlets content pages based on TOC modules (see download_modules_toc),
+    or only return their content toc if download is False.
+    Pages downloads are scheduled on configuration.download_pool and may still be pending on return.
+    The returned content toc also lists the modules built by the other shards, see Configuration.in_shard.
+    """
+
+    # modules toc is a web based TOC, where as content_toc is file based
+    content_toc = {}
+
     # Downloading modules contents
     for module in modules:
 
@@ -266,326 +1695,1473 @@ def crawl_posh_contents(configuration: Configuration, toc_url : str, download_di
         module_cmdlets = module['children']
         module_dir = os.path.join(download_dir, Configuration.base_url, module_name)
 
-        logging.info("[+] download module %s" % (module_name))
-        module_infos = download_module_contents(configuration, module_name, module_uri, module_dir,  module_cmdlets, download_dir)
+        module_download = download and configuration.in_shard(module_name)
+        if module_download:
+            logging.info("[+] download module %s" % (module_name))
+        module_infos = download_module_contents(configuration, module_name, module_uri, module_dir,  module_cmdlets, download_dir, module_download)
         content_toc[module_name] = module_infos
 
     return content_toc
 
+# Additional theme resource to download : (absolute url, path relative to documents dir)
+ThemeResourceRecord = collections.namedtuple('ThemeResourceRecord', 'url, path')
+
+def match_tag(tag : Tag, attrs : dict):
+    """ findAll-like matching of a tag attributes, multi-valued attributes (class, rel) match on any value """
+    for attr, value in attrs.items():
+        tag_value = tag.get(attr)
+
+        if tag_value is None:
+            return False
+
+        if isinstance(tag_value, list):
+            if value not in tag_value and value != " ".join(tag_value):
+                return False
+        elif tag_value != value:
+            return False
+
+    return True
+
+def walk_soup(soup, nav_elements : list, visit):
+    """ 
+    Single-pass traversal of the html tree, in document order : tags matching one of nav_elements are removed 
+    along with their children, every other tag is given to visit(tag, in_head). 
+    Children are not visited if visit returns False.
+    """
+
+    # nav elements rules indexed by tag name
+    nav_rules = collections.defaultdict(list)
+    for nav_class, nav_attr in nav_elements:
+        nav_rules[nav_class].append(nav_attr)
+
+    def children(tag, in_head):
+        return [(child, in_head) for child in reversed(list(tag.children)) if isinstance(child, Tag)]
+
+    stack = children(soup, False)
+    while stack:
+        tag, in_head = stack.pop()
+
+        if any(match_tag(tag, nav_attr) for nav_attr in nav_rules.get(tag.name, [])):
+            _ = tag.extract()
+            continue
+
+        in_head = in_head or tag.name == "head"
+        if visit(tag, in_head) is not False:
+            stack.extend(children(tag, in_head))
+
+def rewrite_stylesheet_link(link : Tag, html_path : str, documents_dir : str):
+    """ rewrite a theme stylesheet link as a relative link, and return the resource to download """
+    uri_path = link['href'].strip()
+
+    if not uri_path.lstrip('/').startswith(Configuration.default_theme_uri):
+        return None
+
+    # Construct (url, path) tuple
+    theme_output_dir = os.path.join(documents_dir, Configuration.domain)
+    css_url = "https://%s/%s" % (Configuration.domain, uri_path)
+    css_filepath =  os.path.join(theme_output_dir, uri_path.lstrip('/'))
+
+    # Converting href to a relative link
+    path = os.path.relpath(css_filepath, os.path.dirname(html_path))
+    rel_uri = '/'.join(path.split(os.sep))
+    link['href'] = rel_uri
+
+    return ThemeResourceRecord( 
+        url = css_url, 
+        path = os.path.relpath(css_filepath, documents_dir), # stored as relative path
+    )
+
+def local_resource_path(url : str, documents_dir : str):
+    """ local path of a docs website resource, mirroring its url path, or None for other websites """
+    parsed_url = urllib.parse.urlparse(url)
+    if parsed_url.netloc != Configuration.domain or not parsed_url.path.strip('/'):
+        return None
+
+    return os.path.join(documents_dir, Configuration.domain, *urllib.parse.unquote(parsed_url.path).strip('/').split('/'))
+
+def rewrite_image_link(img : Tag, html_path : str, documents_dir : str):
+    """ rewrite an image source as a relative link, and return the resource to download """
+    src = img['src'].strip()
+    if not src or src.startswith("data:"):
+        return None
+
+    # html pages paths mirror their url
+    page_url = "https://%s" % '/'.join(os.path.relpath(html_path, documents_dir).split(os.sep))
+    image_url = urllib.parse.urljoin(page_url, src).split('#')[0]
+    image_filepath = local_resource_path(image_url, documents_dir)
+    if not image_filepath:
+        return None
+
+    path = os.path.relpath(image_filepath, os.path.dirname(html_path))
+    img['src'] = '/'.join(path.split(os.sep))
+
+    return ThemeResourceRecord(
+        url = image_url,
+        path = os.path.relpath(image_filepath, documents_dir),
+    )
+
+class PageSymbols:
+    """ 
+    Extract in-page symbols (parameters, examples, inputs and outputs types, aliases) during the rewrite 
+    traversal, and mark them and the page sections with dashAnchor table of contents anchors.
+    Symbols are (index name, entry type, anchor) tuples.
+    """
+
+    # h2 section id -> entry type of its h3 headers
+    section_entry_types = {
+        "examples" : "Section",
+        "parameters" : "Parameter",
+        "inputs" : "Type",
+        "outputs" : "Type",
+    }
+
+    alias_pattern = re.compile(r"^[\w\-\?%]+$")
+    alias_mention_pattern = re.compile(r"\balias", re.IGNORECASE)
+
+    def __init__(self, soup, page_name : str):
+        self.soup = soup
+        self.page_name = page_name
+        self.section = None
+        self.alias_list = None
+        self.anchors = set()
+        self.symbols = []
+
+    def add_anchor(self, tag : Tag, entry_type : str, name : str):
+        """ insert a dashAnchor before tag (which must allow an inline sibling), return None if the page already has the same anchor """
+        anchor = "//apple_ref/cpp/%s/%s" % (entry_type, urllib.parse.quote(name, safe=''))
+        if anchor in self.anchors:
+            return None
+
+        self.anchors.add(anchor)
+        tag.insert_before(self.soup.new_tag("a", attrs = { "name" : anchor, "class" : "dashAnchor" }))
+        return anchor
+
+    def add_aliases(self, tag : Tag):
+        """ aliases are listed as inline code in the notes section, and indexed as commands """
+        for code in tag.find_all("code"):
+            alias = code.get_text(strip = True)
+            if not self.alias_pattern.match(alias) or alias.lower() == self.page_name.lower():
+                continue
+
+            # anchored within the paragraph or list item, before the alias code
+            anchor = self.add_anchor(code, "Command", alias)
+            if anchor:
+                self.symbols.append((alias, "Command", anchor))
+
+    def visit(self, tag : Tag):
+
+        if tag.name == "h2":
+            self.section = tag.get("id")
+            self.alias_list = None
+
+            title = tag.get_text(" ", strip = True)
+            if title:
+                self.add_anchor(tag, "Section", title)
+
+        elif tag.name == "h3" and self.section in self.section_entry_types:
+            title = tag.get_text(" ", strip = True)
+            entry_type = self.section_entry_types[self.section]
+
+            anchor = self.add_anchor(tag, entry_type, title)
+            if anchor and title:
+                # prefixed by their cmdlet, types (e.g. System.String) being listed by most of them
+                self.symbols.append(("%s %s" % (self.page_name, title), entry_type, anchor))
+
+        elif self.section == "notes" and tag.name in ("p", "li"):
+            mentions_aliases = bool(self.alias_mention_pattern.search(tag.get_text(" ", strip = True)))
+
+            # "PowerShell includes the following aliases for X :" followed by a list
+            if mentions_aliases or (tag.name == "li" and tag.parent is self.alias_list):
+                self.add_aliases(tag)
+
+            # the alias list is the one right after the paragraph
+            if tag.name == "p":
+                next_tag = tag.find_next_sibling()
+                self.alias_list = next_tag if mentions_aliases and next_tag and next_tag.name in ("ul", "ol") else None
+
+
+class LinkResolver:
+    """ 
+    Link resolution table, built once from the merged content toc : maps the upstream path of every module, 
+    cmdlet and about_ topic page ("<module>[/<cmdlet>|/about/<topic>]", lowercased) to its documents relative path. 
+    Links are resolved with a single lookup, across modules and toc trees (e.g. from the windows server modules).
+    """
+
+    upstream_domains = (Configuration.domain, "learn.microsoft.com")
+    modules_path = "/powershell/module/"
+
+    def __init__(self, content_toc : dict):
+
+        self.paths = {}
+        for module_name, module in content_toc.items():
+            module_key = module_name.lower()
+            self.paths[module_key] = module['index'].replace(os.sep, '/')
+
+            for cmdlet in module['cmdlets']:
+                self.paths.setdefault("%s/%s" % (module_key, cmdlet['name'].lower()), cmdlet['path'].replace(os.sep, '/'))
+
+            for topic in module.get('about', []):
+                self.paths["%s/about/%s" % (module_key, topic['name'].lower())] = topic['path'].replace(os.sep, '/')
+
+        # shards must be built against the same table, see export_shard
+        self.digest = hashlib.sha256(json.dumps(sorted(self.paths.items())).encode("utf8")).hexdigest()
+
+        # resolved links, by (page folder, href) : (table key, target)
+        self.resolved = {}
+
+    def _lookup(self, href : str, page_dir : str):
+        key = (page_dir, href)
+        if key in self.resolved:
+            return self.resolved[key]
+
+        # pages are stored like their upstream urls, which relative links are based on
+        url = urllib.parse.urlsplit(urllib.parse.urljoin("https://%s/" % page_dir, href))
+        module_path = url.path.lower().partition(self.modules_path)[2].strip("/")
+
+        # links outside of the modules docs never resolve, whatever the table
+        table_key = module_path if url.netloc in self.upstream_domains and module_path else None
+
+        target = None
+        if table_key in self.paths:
+            target = posixpath.relpath(self.paths[table_key], page_dir)
+            if url.fragment:
+                target = "%s#%s" % (target, url.fragment)
+
+        self.resolved[key] = (table_key, target)
+        return self.resolved[key]
+
+    def resolve(self, href : str, page_path : str):
+        """ link to the page targeted by href, relative to page_path (documents relative), or None if it is not in the docset """
+        return self._lookup(href, posixpath.dirname(page_path))[1]
+
+    def resolution(self, href : str, page_path : str):
+        """ (table key, table entry or None) the resolution of href depends on, or None if it does not depend on the table """
+        table_key = self._lookup(href, posixpath.dirname(page_path))[0]
+        if table_key is None:
+            return None
+        return table_key, self.paths.get(table_key)
+
+    def unchanged(self, resolutions : dict):
+        """ whether the links of a page resolved against another table (see resolution) still resolve the same """
+        return resolutions is not None and all(self.paths.get(key) == path for key, path in resolutions.items())
+
+# Global link resolution table of the build, see LinkResolver
+link_resolver = None
+
+def set_link_resolver(resolver : LinkResolver):
+    """ install the link resolution table, in the main process and in the html rewriting worker processes """
+    global link_resolver
+    link_resolver = resolver
+
+
+# unsupported nav elements of the module, cmdlet and about_ pages, removed along with their children (see walk_soup)
+page_nav_elements = [
+    ["nav"  , { "class" : "doc-outline", "role" : "navigation"}],
+    ["ul"   , { "class" : "breadcrumbs", "role" : "navigation"}],
+    ["div"  , { "class" : "sidebar", "role" : "navigation"}],
+    ["div"  , { "class" : "dropdown dropdown-full mobilenavi"}],
+    ["p"    , { "class" : "api-browser-description"}],
+    ["div"  , { "class" : "api-browser-search-field-container"}],
+    ["div"  , { "class" : "pageActions"}],
+    ["div"  , { "class" : "container footerContainer"}],
+    ["div"  , { "class" : "dropdown-container"}],
+    ["div"  , { "class" : "page-action-holder"}],
+    ["div"  , { "aria-label" : "Breadcrumb", "role" : "navigation"}],
+    ["div"  , { "data-bi-name" : "rating"}],
+    ["div"  , { "data-bi-name" : "feedback-section"}],
+    ["section" , { "class" : "feedback-section", "data-bi-name" : "feedback-section"}],
+    ["footer" , { "data-bi-name" : "footer", "id" : "footer"}],
+]
+
 def rewrite_soup(configuration : Configuration, soup, html_path : str, documents_dir : str):
+    """ 
+    rewrite html contents by fixing links and remove unnecessary cruft, and extract the page symbols 
+    along with the links which did not resolve to a docset page and the link table entries used (see LinkResolver)
+    """
+
+    theme_resources = []
+    page_symbols = PageSymbols(soup, os.path.splitext(os.path.basename(html_path))[0])
+
+    page_path = os.path.relpath(html_path, documents_dir).replace(os.sep, '/')
+    unresolved_links = []
+    link_resolutions = {}
+
+    def visit(tag, in_head):
+
+        # in-page symbols to index
+        if not in_head:
+            page_symbols.visit(tag)
+
+        if tag.name == "a" and tag.get("data-linktype") in ("relative-path", "absolute-path"):
+
+            # Fix navigations links, to modules, cmdlets and about_ topics
+            href = tag.get("href", "")
+            resolution = link_resolver.resolution(href, page_path)
+            if resolution:
+                link_resolutions[resolution[0]] = resolution[1]
+
+            target = link_resolver.resolve(href, page_path)
+            if target:
+                logging.debug("link rewrite : %s -> %s " % (tag.get("href"), target))
+                tag['href'] = target
+
+            # remove links to pages missing from the docset since we can't support them
+            else:
+                unresolved_links.append(href)
+                tag.replace_with(tag.text)
+                return False
+
+        elif in_head and tag.name == "script":
+            _ = tag.extract()
+            return False
+
+        # Extract and rewrite additionnal stylesheets to download
+        elif in_head and tag.name == "link" and match_tag(tag, { "rel" : "stylesheet"}):
+            resource = rewrite_stylesheet_link(tag, html_path, documents_dir)
+            if resource:
+                theme_resources.append(resource)
+
+        # Extract and rewrite images to download
+        elif tag.name == "img" and tag.get("src"):
+            resource = rewrite_image_link(tag, html_path, documents_dir)
+            if resource:
+                theme_resources.append(resource)
+
+    # links, cruft, stylesheets, images and symbols are all processed in a single traversal
+    walk_soup(soup, page_nav_elements, visit)
+
+    return soup, set(theme_resources), page_symbols.symbols, unresolved_links, link_resolutions
+
+def report_unresolved_links(unresolved_links : dict):
+    """ log the links removed from the rewritten pages since they did not resolve to a docset page """
+    count = sum(len(links) for links in unresolved_links.values())
+    metrics.count("unresolved_links", count)
+    if not count:
+        return
+
+    logging.warning("%d links to pages missing from the docset were removed from %d pages" % (count, len(unresolved_links)))
+    for relpath, links in sorted(unresolved_links.items()):
+        for href in links:
+            logging.debug("  unresolved link : %s -> %s" % (relpath, href))
+
+# unsupported nav elements of the modules index start page
+index_nav_elements = [
+    ["nav"  , { "class" : "doc-outline", "role" : "navigation"}],
+    ["ul"   , { "class" : "breadcrumbs", "role" : "navigation"}],
+    ["div"  , { "class" : "sidebar", "role" : "navigation"}],
+    ["div"  , { "class" : "dropdown dropdown-full mobilenavi"}],
+    ["p"    , { "class" : "api-browser-description"}],
+    ["div"  , { "class" : "api-browser-search-field-container"}],
+    ["div"  , { "class" : "pageActions"}],
+    ["div"  , { "class" : "dropdown-container"}],
+    ["div"  , { "class" : "container footerContainer"}],
+    ["div"  , { "data-bi-name" : "header", "id" : "headerAreaHolder"}],
+    ["div"  , { "class" : "header-holder"}],
+    ["div"  , { "id" : "action-panel"}],
+    ["div"  , { "id" : "api-browser-search-field-container"}],
+]
+
+def rewrite_index_soup(configuration : Configuration, soup, index_html_path : str, documents_dir : str):
     """ rewrite html contents by fixing links and remove unnecessary cruft """
 
-    # Fix navigations links
-    links = soup.findAll("a", { "data-linktype" : "relative-path"}) # for modules and cmdlet pages
-    link_pattern = re.compile(r"([\w\.\/-]+)\?view=[powershell-|windowsserver2019-ps]")
+    index_page_path = os.path.relpath(index_html_path, documents_dir).replace(os.sep, '/')
+    module_svg_path = os.path.join(documents_dir, Configuration.domain, "en-us", "media", "toolbars", "module.svg")
 
-    for link in links:
+    stylesheets = []
 
+    def fix_module_link(link):
+        """ rewrite module links in the api search results, see LinkResolver """
         href = link['href']
-        fixed_href = href
-
-        # go back to module
-        if href == "./?view=powershell-%s" % configuration.powershell_version:
-            fixed_href = "./%s.html" % link.text
-        elif href == "./?view=windowsserver2019-ps":
-            fixed_href = "./%s.html" % link.text
 
-        # go to a cmdlet page
-        else:
-            targets = link_pattern.findall(href)
-            if not len(targets): # badly formated 'a' link
-                continue
+        fixed_href = link_resolver.resolve(href, index_page_path)
+        if not fixed_href: 
+            logging.debug("unresolved module link : %s" % href)
+            return
 
-            module_name = targets[0]
-            fixed_href = "%s.html" % module_name
-        
         if fixed_href != href:
             logging.debug("link rewrite : %s -> %s " % ( href, fixed_href))
             link['href'] = fixed_href
 
+    def visit_content_table(tag, in_head):
 
-    # remove link to external references since we can't support it
-    for abs_href in soup.findAll("a", { "data-linktype" : "absolute-path"}):
-        abs_href.replace_with(abs_href.text)
-
-    # remove unsupported nav elements
-    nav_elements = [
-        ["nav"  , { "class" : "doc-outline", "role" : "navigation"}],
-        ["ul"   , { "class" : "breadcrumbs", "role" : "navigation"}],
-        ["div"  , { "class" : "sidebar", "role" : "navigation"}],
-        ["div"  , { "class" : "dropdown dropdown-full mobilenavi"}],
-        ["p"    , { "class" : "api-browser-description"}],
-        ["div"  , { "class" : "api-browser-search-field-container"}],
-        ["div"  , { "class" : "pageActions"}],
-        ["div"  , { "class" : "container footerContainer"}],
-        ["div"  , { "class" : "dropdown-container"}],
-        ["div"  , { "class" : "page-action-holder"}],
-        ["div"  , { "aria-label" : "Breadcrumb", "role" : "navigation"}],
-        ["div"  , { "data-bi-name" : "rating"}],
-        ["div"  , { "data-bi-name" : "feedback-section"}],
-        ["section" , { "class" : "feedback-section", "data-bi-name" : "feedback-section"}],
-        ["footer" , { "data-bi-name" : "footer", "id" : "footer"}],
-    ]
-
-    for nav in nav_elements:
-        nav_class, nav_attr = nav
-        
-        for nav_tag in soup.findAll(nav_class, nav_attr):
-            _ = nav_tag.extract()
+        # Fix navigations links
+        if tag.name == "a" and tag.get('href') is not None:
+            fix_module_link(tag)
+
+        # Fix link to module.svg
+        elif tag.name == "img" and match_tag(tag, {'alt' : "Module"}):
+            tag['src'] =  '/'.join(os.path.relpath(module_svg_path, os.path.dirname(index_html_path)).split(os.sep))
+
+    def visit(tag, in_head):
+
+        if tag.name == "table" and match_tag(tag, { "class" : "api-search-results" }):
+            walk_soup(tag, [], visit_content_table)
+
+        # remove script elems
+        elif tag.name == "script" and (in_head or match_tag(tag, { "async" : "",  "defer" : ""})):
+            _ = tag.extract()
+            return False
+
+        # Fixing css stylesheets
+        elif in_head and tag.name == "link" and match_tag(tag, { "rel" : "stylesheet"}):
+            resource = rewrite_stylesheet_link(tag, index_html_path, documents_dir)
+            if resource:
+                stylesheets.append(resource)
+
+    # links, cruft and stylesheets are all processed in a single traversal
+    walk_soup(soup, index_nav_elements, visit)
+
+    return soup, set(stylesheets)
+
+
+# attributes whose mere presence matters, kept even when empty
+html_boolean_attributes = {
+    "allowfullscreen", "async", "autofocus", "autoplay", "checked", "controls", "default", "defer", "disabled",
+    "download", "formnovalidate", "hidden", "ismap", "itemscope", "loop", "multiple", "muted", "nomodule",
+    "novalidate", "open", "readonly", "required", "reversed", "selected",
+}
+
+# valued attributes whose empty value is meaningful (e.g. alt="" marks a decorative image), kept as well
+html_empty_valued_attributes = {"alt", "value"}
+
+# elements whose text must be kept verbatim
+html_preformatted_elements = {"pre", "textarea", "script", "style"}
+
+def minify_soup(soup):
+    """ strip comments and empty attributes, and collapse whitespace outside of preformatted elements """
+
+    for comment in soup.find_all(string = lambda s: isinstance(s, Comment)):
+        comment.extract()
+
+    # merge the strings surrounding removed comments
+    soup.smooth()
+
+    whitespace = re.compile(r"\s+")
+    for text in soup.find_all(string = True):
+        if type(text) is not NavigableString:
+            continue # doctype, cdata, ...
+        if any(parent.name in html_preformatted_elements for parent in text.parents):
+            continue
+
+        collapsed = whitespace.sub(" ", text)
+        if collapsed != text:
+            text.replace_with(collapsed)
+
+    for tag in soup.find_all(True):
+        for attr, value in list(tag.attrs.items()):
+            if attr not in html_boolean_attributes and attr not in html_empty_valued_attributes and (value == "" or value == []):
+                del tag[attr]
+
+    return soup
+
+def serialize_soup(configuration : Configuration, soup):
+    """ utf-8 html of a soup, either indented (prettify) or minified according to configuration.html_output """
+    if configuration.html_output == "minified":
+        return minify_soup(soup).encode("utf-8")
+
+    return soup.prettify("utf-8")
+
+def page_text(soup):
+    """ (title, cleaned body text) of a rewritten page, indexed in the full-text search table """
+    content = soup.find("main") or soup.body or soup
+
+    title_tag = content.find("h1") or soup.find("title")
+    title = title_tag.get_text(" ", strip = True) if title_tag else ""
 
-    # remove script elems
-    for head_script in soup.head.findAll("script"):
-            _ = head_script.extract()
+    strings = (
+        text for text in content.find_all(string = True) 
+        if type(text) is NavigableString and text.parent.name not in ("script", "style")
+    )
+    return title, " ".join(" ".join(strings).split())
+
+def page_text_file(html_file : str, html_parser : str = "html.parser"):
+    """ page_text of an already rewritten html file """
+    with open(html_file, 'r', encoding='utf8') as f:
+        return page_text(bs(f.read(), html_parser))
+
+
+def rewrite_html_file(configuration : Configuration, src_file : str, html_file : str, html_root_dir : str):
+    """ 
+    rewrite a single html file, and return its rewrite record (output hash, additional resources to download, 
+    page symbols, unresolved links and link table entries), the time spent in each step (see BuildMetrics) 
+    and the page text if configuration.full_text is set
+    """
+
+    logging.debug("rewrite  html_file : %s" % (html_file))
+
+    # Read content and parse html
+    start = time.perf_counter()
+    with open(src_file, 'r', encoding='utf8') as i_fd:
+        html_content = i_fd.read()
+
+    soup = bs(html_content, configuration.html_parser)
+    parsed = time.perf_counter()
     
-    # Extract and rewrite additionnal stylesheets to download
-    ThemeResourceRecord = collections.namedtuple('ThemeResourceRecord', 'url, path')
+    # rewrite html
+    soup, resources, symbols, unresolved_links, link_resolutions = rewrite_soup(configuration, soup, html_file, html_root_dir)
+    text = page_text(soup) if configuration.full_text else None
+    rewritten = time.perf_counter()
+
+    # minified output : a sample of the pages is also prettified, to report the size and time savings
+    prettify_sample = None
+    if configuration.html_output == "minified" and configuration.collect_metrics and zlib.crc32(html_file.encode("utf8")) % 20 == 0:
+        prettify_sample = (len(soup.prettify("utf-8")), time.perf_counter() - rewritten)
+        rewritten = time.perf_counter()
+
+    # Export fixed html
+    fixed_html = serialize_soup(configuration, soup)
+    serialized = time.perf_counter()
+    os.makedirs(os.path.dirname(html_file), exist_ok = True)
+    write_file_atomic(html_file, fixed_html)
+
+    timings = {
+        'parse_time' : parsed - start,
+        'rewrite_time' : rewritten - parsed,
+        'serialize_time' : serialized - rewritten,
+        'output_size' : len(fixed_html),
+    }
+    if prettify_sample:
+        timings['prettify_size'], timings['prettify_time'] = prettify_sample
+
+    record = {
+        'output' : hashlib.sha256(fixed_html).hexdigest(),
+        'resources' : sorted(resources),
+        'symbols' : symbols,
+        'unresolved_links' : unresolved_links,
+        'links' : link_resolutions,
+    }
+    return record, timings, text
 
-    theme_output_dir = os.path.join(documents_dir, Configuration.domain)
-    theme_resources = []
 
-    for link in soup.head.findAll("link", { "rel" : "stylesheet"}):
-        uri_path = link['href'].strip()
+def rewrite_html_contents(configuration : Configuration, src_root_dir : str, html_root_dir : str, manifest, page_texts : dict = None):
+    """ 
+    rewrite every html file downloaded from src_root_dir into html_root_dir.
+    Files whose source and previous output are unchanged since the last build are skipped,
+    the other ones are distributed across configuration.jobs worker processes.
+    page_texts, if given, receives the text of the rewritten pages (see page_text).
+    """
 
-        if not uri_path.lstrip('/').startswith(Configuration.default_theme_uri):
+    additional_resources = set()
+    rewrite_records = {}
+    rewrite_tasks = []
+
+    # sorted to keep records and logs deterministic
+    for src_file in sorted(glob.glob("%s/**/*.html" % src_root_dir, recursive = True)):
+
+        relpath = os.path.relpath(src_file, src_root_dir)
+        html_file = os.path.join(html_root_dir, relpath)
+        src_digest = file_digest(src_file)
+
+        # reuse previous build output, or the same page rewritten for another version
+        record = manifest.unchanged_rewrite(relpath, src_digest, html_file)
+        if not record and configuration.shared_outputs:
+            record = configuration.shared_outputs.reuse_rewrite(relpath, src_digest, html_file)
+        if record:
+            logging.debug("rewrite  html_file : %s (unchanged)" % (html_file))
+            rewrite_records[relpath] = record
+            additional_resources.update(ThemeResourceRecord(*r) for r in record['resources'])
+            if configuration.shared_outputs:
+                configuration.shared_outputs.add_rewrite(relpath, src_digest, html_file, record)
             continue
 
-        # Construct (url, path) tuple
-        css_url = "https://%s/%s" % (Configuration.domain, uri_path)
-        css_filepath =  os.path.join(theme_output_dir, uri_path.lstrip('/'))
+        rewrite_tasks.append((relpath, src_file, html_file, src_digest))
+
+    task_args = [(configuration, src_file, html_file, html_root_dir) for _, src_file, html_file, _ in rewrite_tasks]
+
+    # forking while the download, http client or --watch status threads are alive is unsafe, hence the "spawn" context
+    # (a multiprocessing pool, ProcessPoolExecutor only supports initializers from python 3.7)
+    if configuration.jobs > 1 and len(rewrite_tasks) > 1:
+        chunksize = max(1, len(rewrite_tasks) // (configuration.jobs * 4))
+        with multiprocessing.get_context("spawn").Pool(configuration.jobs, set_link_resolver, (link_resolver,)) as pool:
+            results = pool.starmap(rewrite_html_file, task_args, chunksize)
+    else:
+        results = list(itertools.starmap(rewrite_html_file, task_args))
+
+    for (relpath, src_file, html_file, src_digest), (record, timings, text) in zip(rewrite_tasks, results):
+        metrics.record_rewrite(relpath, timings)
+        if text and page_texts is not None:
+            page_texts[relpath] = text
+        additional_resources.update(ThemeResourceRecord(*r) for r in record['resources'])
+        rewrite_records[relpath] = dict(record, source = src_digest)
+        if configuration.shared_outputs:
+            configuration.shared_outputs.add_rewrite(relpath, src_digest, html_file, rewrite_records[relpath])
+
+    manifest.replace("rewrite", rewrite_records)
+    return additional_resources
+
+
+class StreamingPipeline:
+    """ 
+    Streaming mode : every page is rewritten as soon as it is downloaded, and its index record is then
+    queued to an indexer thread which writes the sqlite database while the crawl is still running.
+    The number of pages waiting to be rewritten is bounded, which keeps memory usage flat.
+    """
+
+    def __init__(self, configuration : Configuration, document_dir : str, resources_dir : str, manifest):
+
+        self.configuration = configuration
+        self.document_dir = document_dir
+        self.manifest = manifest
+
+        # forking while the download threads are running is unsafe, hence the "spawn" context
+        # workers resolve links against the table of the build, which must be set beforehand (see LinkResolver)
+        # (a multiprocessing pool, ProcessPoolExecutor only supports initializers from python 3.7)
+        self.pool = None
+        if configuration.jobs > 1:
+            self.pool = multiprocessing.get_context("spawn").Pool(configuration.jobs, set_link_resolver, (link_resolver,))
+        self.in_flight = threading.BoundedSemaphore(configuration.jobs * 4)
+
+        self.lock = threading.Lock()
+        self.errors = []
+        self.resources = set()
+        self.rewrite_records = {}
+
+        # records are sequenced in toc order, see _index_records
+        self.next_sequence = 0
+        self.index_queue = queue.Queue()
+        self.sqlite_filepath = os.path.join(resources_dir, "docSet.dsidx")
+        self.indexer = threading.Thread(target = self._index_records, daemon = True)
+        self.indexer.start()
+
+    def schedule(self, src_file : str, src_root_dir : str, index_record : tuple):
+        """ 
+        Reserve a page in the pipeline (in toc order), and return the callback to invoke once src_file is downloaded.
+        index_record is the (name, type, path) database record for this page, or None if not indexed.
+        """
+        sequence = self.next_sequence
+        self.next_sequence += 1
+
+        return lambda: self._rewrite(sequence, src_file, src_root_dir, index_record)
+
+    def schedule_toc(self, content_toc : dict, src_root_dir : str):
+        """ push every page from an already downloaded content toc """
+        for module_name, module in content_toc.items():
+
+            module_filepath = os.path.join(src_root_dir, module['index'])
+            self.schedule(module_filepath, src_root_dir, (module_name, "Module", module['index']))()
+
+            for cmdlet in module['cmdlets']:
+                cmdlet_filepath = os.path.join(src_root_dir, cmdlet['path'])
+                index_record = (cmdlet['name'], "Command", cmdlet['path'])
+                if cmdlet['name'] == module_name:
+                    index_record = None
+
+                self.schedule(cmdlet_filepath, src_root_dir, index_record)()
+
+            for topic in module.get('about', []):
+                topic_filepath = os.path.join(src_root_dir, topic['path'])
+                self.schedule(topic_filepath, src_root_dir, (topic['name'], "Guide", topic['path']))()
+
+    def _rewrite(self, sequence : int, src_file : str, src_root_dir : str, index_record : tuple):
+
+        # module without index page
+        if not os.path.exists(src_file):
+            self.index_queue.put((sequence, None, index_record, [], None))
+            return
+
+        relpath = os.path.relpath(src_file, src_root_dir)
+        html_file = os.path.join(self.document_dir, relpath)
+        src_digest = file_digest(src_file)
+
+        # reuse previous build output
+        record = self.manifest.unchanged_rewrite(relpath, src_digest, html_file)
+        if record:
+            logging.debug("rewrite  html_file : %s (unchanged)" % (html_file))
+            self._rewritten(sequence, relpath, record, index_record)
+            return
+
+        def on_rewritten(result):
+            record, timings, text = result
+            metrics.record_rewrite(relpath, timings)
+            self._rewritten(sequence, relpath, dict(record, source = src_digest), index_record, text)
+
+        if not self.pool:
+            on_rewritten(rewrite_html_file(self.configuration, src_file, html_file, self.document_dir))
+            return
+
+        # wait for a free slot, blocking the download worker
+        self.in_flight.acquire()
+
+        # invoked from the pool result thread
+        def on_done(result):
+            try:
+                on_rewritten(result)
+            except Exception as e:
+                self.errors.append(e)
+            finally:
+                self.in_flight.release()
+
+        def on_error(e):
+            self.errors.append(e)
+            self.in_flight.release()
+
+        args = (self.configuration, src_file, html_file, self.document_dir)
+        self.pool.apply_async(rewrite_html_file, args, callback = on_done, error_callback = on_error)
+
+    def _rewritten(self, sequence : int, relpath : str, record : dict, index_record : tuple, text : tuple = None):
+        with self.lock:
+            self.rewrite_records[relpath] = record
+            self.resources.update(ThemeResourceRecord(*r) for r in record['resources'])
+
+        self.index_queue.put((sequence, relpath, index_record, record['symbols'], text))
+
+    def _index_records(self):
+        """ 
+        indexer thread : records are added in toc order as soon as every previous one has landed,
+        so the deduplication rules give the same results as create_sqlite_database
+        """
+
+        index_builder = SqliteIndexBuilder(
+            self.sqlite_filepath, 
+            self.document_dir if self.configuration.full_text else None, 
+            self.configuration.html_parser
+        )
+
+        landed = {}
+        next_sequence = 0
+        while True:
+            item = self.index_queue.get()
+            if item is None:
+                break
+
+            sequence = item[0]
+            landed[sequence] = item[1:]
+
+            while next_sequence in landed:
+                relpath, index_record, symbols, text = landed.pop(next_sequence)
+                next_sequence += 1
+                if index_record:
+                    index_builder.add(*index_record)
+                    index_builder.add_symbols(index_record[2], symbols)
+                if relpath and index_builder.full_text_dir:
+                    index_builder.add_page_text(relpath, text)
+
+        if landed:
+            index_builder.abort()
+            self.errors.append(RuntimeError("%d index records never landed" % len(landed)))
+            return
+
+        index_builder.finish()
+
+    def close(self):
+        """ wait for every pending rewrite and for the indexer, and return the additional resources to download """
+
+        if self.pool:
+            self.pool.close()
+            self.pool.join()
+
+        self.index_queue.put(None)
+        self.indexer.join()
+
+        if self.errors:
+            raise self.errors[0]
+
+        self.manifest.replace("rewrite", self.rewrite_records)
+        return self.resources
+
+
+def render_index_soup(configuration : Configuration, content_toc : dict, index_html_path : str, documents_dir : str, stylesheets : list):
+    """ build the modules index start page from the content toc, without any browser """
+
+    module_svg_path = os.path.join(documents_dir, Configuration.domain, "en-us", "media", "toolbars", "module.svg")
+    index_dir = os.path.dirname(index_html_path)
+
+    def relative_uri(filepath):
+        return '/'.join(os.path.relpath(filepath, index_dir).split(os.sep))
+
+    soup = bs("<!DOCTYPE html><html><head></head><body></body></html>", configuration.html_parser)
 
-        # Converting href to a relative link
-        path = os.path.relpath(css_filepath, os.path.dirname(html_path))
-        rel_uri = '/'.join(path.split(os.sep))
-        link['href'] = rel_uri
+    meta = soup.new_tag("meta", charset = "utf-8")
+    title = soup.new_tag("title")
+    title.string = "PowerShell %s module browser" % configuration.powershell_version
+    soup.head.append(meta)
+    soup.head.append(title)
+
+    for resource in stylesheets:
+        soup.head.append(soup.new_tag("link", 
+            rel = "stylesheet", 
+            href = relative_uri(os.path.join(documents_dir, resource.path))
+        ))
+
+    header = soup.new_tag("h1")
+    header.string = "PowerShell %s modules" % configuration.powershell_version
+    soup.body.append(header)
+
+    table = soup.new_tag("table", attrs = {"class" : "api-search-results"})
+    soup.body.append(table)
+
+    for module_name in sorted(content_toc, key = str.lower):
+        row = soup.new_tag("tr")
+        cell = soup.new_tag("td")
+        row.append(cell)
+        table.append(row)
+
+        cell.append(soup.new_tag("img", alt = "Module", src = relative_uri(module_svg_path)))
+        link = soup.new_tag("a", href = relative_uri(os.path.join(documents_dir, content_toc[module_name]['index'])))
+        link.string = module_name
+        cell.append(link)
+
+    return soup
+
+
+def download_additional_resources(configuration : Configuration, documents_dir : str, content_toc : dict, resources_to_dl : set = set()):
+    """ Download optional resources for "beautification """
+
+    asset_store = AssetStore(configuration, os.path.join(configuration.build_folder, "_assets"), documents_dir)
+    resources_to_dl = set(resources_to_dl)
+
+    # module.svg icon for start page
+    icon_module_url  =     '/'.join(["https:/"   , Configuration.domain, "en-us", "media", "toolbars", "module.svg"])
+    icon_module_path = os.path.join(Configuration.domain, "en-us", "media", "toolbars", "module.svg")
+    resources_to_dl.add(ThemeResourceRecord(url = icon_module_url, path = icon_module_path))
+
+    # Build or download index start page
+    index_url = Configuration.default_url % configuration.powershell_version
+    index_filepath = os.path.join(documents_dir, Configuration.domain, "en-us", "index.html")
+
+    soup = None
+    if configuration.index_page == "static":
+        soup = bs(http_get(index_url).text, configuration.html_parser)
+
+        # the modules table may only be rendered client-side, fall back on the browser
+        if not soup.find("table", class_ = "api-search-results"):
+            logging.warning("modules table not found in the static index page, falling back on the browser")
+            soup = None
+
+    if configuration.index_page == "toc":
+        stylesheets = sorted(r for r in resources_to_dl if r.path.endswith(".css"))
+        soup = render_index_soup(configuration, content_toc, index_filepath, documents_dir, stylesheets)
+    elif soup is None:
+        soup = bs( configuration.webdriver.get_url_page(index_url), configuration.html_parser)
+
+    if configuration.index_page != "toc":
+        soup, stylesheets = rewrite_index_soup(configuration, soup, index_filepath, documents_dir)
+        resources_to_dl.update(stylesheets)
+
+    fixed_html = serialize_soup(configuration, soup)
+    os.makedirs(os.path.dirname(index_filepath), exist_ok = True)
+    write_file_atomic(index_filepath, fixed_html)
+
+    # every unique resource is downloaded once, concurrently
+    asset_store.fetch(resources_to_dl)
+    asset_store.prune()
+
+
+def toc_records(content_toc : dict):
+    """ (name, type, path) index records described by the content toc """
+    for module_name, module in content_toc.items():
+
+        yield (module_name, "Module", module['index'])
+
+        for cmdlet in module['cmdlets']:
+
+            # cmdlets named like their module are only indexed as a module
+            if cmdlet['name'] != module_name:
+                yield (cmdlet['name'], "Command", cmdlet['path'])
+
+        # about_ topics (missing from older toc.json files)
+        for topic in module.get('about', []):
+            yield (topic['name'], "Guide", topic['path'])
+
+
+class SqliteIndexBuilder:
+    """ 
+    Batched Dash search index builder. Records are deduplicated in memory, and written using executemany 
+    within a single transaction. An existing database is updated in place : rows already present are kept as is
+    and rows which have not been added again are removed on finish(), which then copies the index to a new
+    database in insertion order (see _write_canonical).
+    If full_text_dir is given, the text of its pages is also indexed in the pageText FTS5 table (see search_full_text).
+    """
+
+    # records are flushed to the database by batches
+    batch_size = 1000
+
+    # entry types whose names must be unique across the whole index
+    unique_name_types = ("Module", "Command")
+
+    def __init__(self, sqlite_filepath : str, full_text_dir : str = None, html_parser : str = "html.parser"):
+
+        self.sqlite_filepath = sqlite_filepath
+        self.full_text_dir = full_text_dir
+        self.html_parser = html_parser
+
+        try:
+            self._open()
+        except sqlite3.DatabaseError as e:
+            # durability is disabled while building, so a crashed build may leave a corrupted database
+            logging.warning("discarding corrupted index database %s : %s" % (sqlite_filepath, e))
+            self.db.close()
+            os.remove(sqlite_filepath)
+            self._open()
+
+        self.names = set()
+        self.paths = set()
+        self.records = set()
+        self.ordered_records = []
+        self.pending = []
+        self.deferred = []
+        self.duplicates = []
+
+        # full-text indexed pages, and the text rows to (re)insert
+        self.text_paths = set()
+        self.ordered_text_paths = []
+        self.stale_texts = []
+        self.pending_texts = []
+        self.texts_inserted = 0
+
+        # insertion throughput, see BuildMetrics
+        self.inserted = 0
+        self.insert_time = 0
+
+        self.db.execute('BEGIN')
+
+    def _open(self):
+        self.db = sqlite3.connect(self.sqlite_filepath, isolation_level = None)
+
+        # the database is a build artifact : no need for durability while building it
+        self.db.execute('PRAGMA journal_mode = OFF')
+        self.db.execute('PRAGMA synchronous = OFF')
+
+        # the anchor index is only created once the table is loaded, see finish()
+        self.db.execute('CREATE TABLE IF NOT EXISTS searchIndex(id INTEGER PRIMARY KEY, name TEXT, type TEXT, path TEXT);')
+
+        self.existing = {
+            (name, record_type, path) : rowid 
+            for rowid, name, record_type, path in self.db.execute('SELECT rowid, name, type, path FROM searchIndex')
+        }
+
+        # pages text rows are keyed by path, and only replaced when the page output digest changed
+        self.existing_texts = {}
+        if not self.full_text_dir:
+            self.db.execute('DROP TABLE IF EXISTS pageText')
+            return
+
+        self.db.execute('CREATE VIRTUAL TABLE IF NOT EXISTS pageText USING fts5(title, body, path UNINDEXED, digest UNINDEXED, tokenize = "porter unicode61");')
+        self.existing_texts = {
+            path : (rowid, digest)
+            for rowid, path, digest in self.db.execute('SELECT rowid, path, digest FROM pageText')
+        }
+
+    def add(self, name : str, record_type : str, path : str):
+        """ add a new record, unless its path (or name for modules and commands) is already indexed """
+
+        # path should be unix compliant
+        path = path.replace(os.sep, '/')
+        record = (name, record_type, path)
+
+        unique_name = record_type in self.unique_name_types
+        if path in self.paths or (unique_name and name in self.names):
+            self.duplicates.append(record)
+            return False
+
+        self.paths.add(path)
+        if unique_name:
+            self.names.add(name)
+        self.records.add(record)
+        self.ordered_records.append(record)
+
+        if record not in self.existing:
+            logging.debug('DB add [%s] >> name: %s, path: %s' % (record_type, name, path))
+            self.pending.append(record)
+            if len(self.pending) >= self.batch_size:
+                self.flush()
+
+        return True
+
+    def add_symbols(self, page_path : str, symbols : list):
+        """ 
+        add a page in-page symbols (see PageSymbols). They are only added on finish(), 
+        so that they never shadow a module or a command page
+        """
+        for name, record_type, anchor in symbols:
+            self.deferred.append((name, record_type, "%s#%s" % (page_path, anchor)))
+
+    def add_page_text(self, path : str, text : tuple = None):
+        """ 
+        full-text index a page, unless its output did not change since the last build.
+        text is the (title, body) of the page (see page_text), read back from the page file if None
+        """
+
+        # path should be unix compliant
+        path = path.replace(os.sep, '/')
+        html_file = os.path.join(self.full_text_dir, path)
+
+        digest = file_digest(html_file)
+        if path in self.text_paths or digest is None:
+            return
+
+        self.text_paths.add(path)
+        self.ordered_text_paths.append(path)
+        existing = self.existing_texts.get(path)
+        if existing and existing[1] == digest:
+            return
+        if existing:
+            self.stale_texts.append((existing[0],))
+
+        title, body = text or page_text_file(html_file, self.html_parser)
+        self.pending_texts.append((title, body, path, digest))
+        if len(self.pending_texts) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """ write pending records """
+        start = time.perf_counter()
+        self.db.executemany('INSERT INTO searchIndex(name, type, path) VALUES (?,?,?)', self.pending)
+        if self.pending_texts:
+            self.db.executemany('INSERT INTO pageText(title, body, path, digest) VALUES (?,?,?,?)', self.pending_texts)
+        self.insert_time += time.perf_counter() - start
+        self.inserted += len(self.pending)
+        self.texts_inserted += len(self.pending_texts)
+        self.pending = []
+        self.pending_texts = []
+
+    def finish(self):
+        """ add in-page symbols, remove stale records, commit and optimize the database """
+        for record in self.deferred:
+            self.add(*record)
+        self.flush()
+
+        stale_rows = []
+        for (name, record_type, path), rowid in self.existing.items():
+            if (name, record_type, path) not in self.records:
+                logging.debug('DB remove [%s] >> name: %s, path: %s' % (record_type, name, path))
+                stale_rows.append((rowid,))
+        self.db.executemany('DELETE FROM searchIndex WHERE rowid = ?', stale_rows)
+
+        # pages removed or rewritten since the last build
+        stale_texts = self.stale_texts + [
+            (rowid,) for path, (rowid, _) in self.existing_texts.items() if path not in self.text_paths
+        ]
+        if stale_texts:
+            self.db.executemany('DELETE FROM pageText WHERE rowid = ?', stale_texts)
+
+        start = time.perf_counter()
+        self.db.execute('COMMIT')
+        self._write_canonical()
+
+        metrics.record_index(
+            records = len(self.records),
+            inserted = self.inserted,
+            removed = len(stale_rows),
+            duplicates = len(self.duplicates),
+            insert_time = self.insert_time,
+            inserts_per_second = self.inserted / self.insert_time if self.insert_time else 0,
+            finish_time = time.perf_counter() - start,
+            full_text_pages = len(self.text_paths),
+            full_text_inserted = self.texts_inserted,
+            full_text_removed = len(stale_texts),
+        )
+
+        logging.debug("index database : %d records (%d added, %d removed)" % (
+            len(self.records), 
+            len(self.records) - (len(self.existing) - len(stale_rows)),
+            len(stale_rows)
+        ))
+
+        if self.duplicates:
+            logging.warning("index database : %d duplicate records dropped" % len(self.duplicates))
+            for name, record_type, path in self.duplicates:
+                logging.warning("  duplicate [%s] >> name: %s, path: %s" % (record_type, name, path))
+
+    def _write_canonical(self):
+        """ 
+        Copy the index to a new database, rows being inserted in the order of this build's records : rowids and
+        sqlite header counters of a database updated in place depend on the previous builds, the copy only on its 
+        contents, like a clean build (reproducible archives, shards merged in toc order, see merge_shard_indexes).
+        """
+        canonical_filepath = "%s.tmp" % self.sqlite_filepath
+        if os.path.exists(canonical_filepath):
+            os.remove(canonical_filepath)
+
+        self.db.execute('ATTACH DATABASE ? AS canonical', (canonical_filepath,))
+        self.db.execute('PRAGMA canonical.journal_mode = OFF')
+        self.db.execute('BEGIN')
+        self.db.execute('CREATE TABLE canonical.searchIndex(id INTEGER PRIMARY KEY, name TEXT, type TEXT, path TEXT);')
+        self.db.executemany('INSERT INTO canonical.searchIndex(name, type, path) VALUES (?,?,?)', self.ordered_records)
+
+        if self.full_text_dir:
+            text_rowids = {path : rowid for rowid, path in self.db.execute('SELECT rowid, path FROM pageText')}
+            self.db.execute('CREATE VIRTUAL TABLE canonical.pageText USING fts5(title, body, path UNINDEXED, digest UNINDEXED, tokenize = "porter unicode61");')
+            self.db.executemany(
+                'INSERT INTO canonical.pageText(title, body, path, digest) SELECT title, body, path, digest FROM main.pageText WHERE rowid = ?',
+                ((text_rowids[path],) for path in self.ordered_text_paths)
+            )
 
-        theme_resources.append( ThemeResourceRecord( 
-            url = css_url, 
-            path = os.path.relpath(css_filepath, documents_dir), # stored as relative path
-        ))
+        self.db.execute('COMMIT')
+        self.db.execute('CREATE UNIQUE INDEX canonical.anchor ON searchIndex (name, type, path);')
+        if self.full_text_dir:
+            self.db.execute("INSERT INTO canonical.pageText(pageText) VALUES ('optimize')")
+        self.db.execute('ANALYZE canonical')
+        self.db.execute('DETACH DATABASE canonical')
+        self.db.close()
 
-    return soup, set(theme_resources)
+        os.replace(canonical_filepath, self.sqlite_filepath)
 
-def rewrite_index_soup(configuration : Configuration, soup, index_html_path : str, documents_dir : str):
-    """ rewrite html contents by fixing links and remove unnecessary cruft """
+    def abort(self):
+        """ 
+        discard the database : without a journal (see _open) a rollback is undefined and may leave it corrupted,
+        the next build indexes everything again
+        """
+        self.db.close()
+        for filepath in (self.sqlite_filepath, "%s.tmp" % self.sqlite_filepath):
+            if os.path.exists(filepath):
+                os.remove(filepath)
 
-    # Fix navigations links
-    content_tables = soup.findAll("table", { 
-        "class" : "api-search-results"
-    })
 
-    for content_table in content_tables:
+def create_sqlite_database(configuration, content_toc, resources_dir, documents_dir, page_symbols : dict = {}, page_texts : dict = {}):
+    """ 
+    Indexing the html document in a format Dash can understand.
+    page_symbols maps every rewritten page relative path to its in-page symbols, see PageSymbols.
+    page_texts maps pages relative paths to their text (see page_text), the missing ones are read back from documents_dir.
+    """
 
-        links = content_table.findAll(lambda tag: tag.name == 'a')
-        link_pattern = re.compile(r"/powershell/module/([\w\.\-]+)/\?view=powershell-")
+    # the database is updated in place, from one build to another
+    index_builder = SqliteIndexBuilder(
+        os.path.join(resources_dir, "docSet.dsidx"), 
+        documents_dir if configuration.full_text else None, 
+        configuration.html_parser
+    )
 
-        for link in links:
+    try:
+        for name, record_type, path in toc_records(content_toc):
+            index_builder.add(name, record_type, path)
+            index_builder.add_symbols(path, page_symbols.get(path, []))
+
+        if configuration.full_text:
+            for path in sorted(page_symbols):
+                index_builder.add_page_text(path, page_texts.get(path))
+
+        index_builder.finish()
+    except BaseException:
+        index_builder.abort()
+        raise
+
+def sqlite_has_fts5():
+    """ whether the sqlite library python is linked to has been compiled with the FTS5 extension """
+    db = sqlite3.connect(":memory:")
+    try:
+        db.execute('CREATE VIRTUAL TABLE fts5_check USING fts5(body);')
+        return True
+    except sqlite3.OperationalError:
+        return False
+    finally:
+        db.close()
+
+def search_full_text(sqlite_filepath : str, query : str, limit : int = 20):
+    """ 
+    Search the pages full-text index of a docset database, best matches first (bm25, titles weighted up).
+    query uses the FTS5 syntax, and is searched as plain words if it is not a valid FTS5 query (e.g. "Get-ChildItem").
+    Return (title, path, snippet) tuples.
+    """
+    search = (
+        "SELECT title, path, snippet(pageText, 1, '[', ']', '...', 16) FROM pageText "
+        "WHERE pageText MATCH ? ORDER BY bm25(pageText, 10.0, 1.0) LIMIT ?"
+    )
 
-            href = link['href']
-            fixed_href = href
+    db = sqlite3.connect(sqlite_filepath)
+    try:
+        try:
+            return db.execute(search, (query, limit)).fetchall()
+        except sqlite3.OperationalError as e:
+            if "no such table" in str(e):
+                raise
+            words = " ".join('"%s"' % word.replace('"', '""') for word in query.split())
+            return db.execute(search, (words, limit)).fetchall()
+    finally:
+        db.close()
+
+def file_digest(filepath : str):
+    """ sha256 of a file content, or None if it does not exist """
+    if not os.path.exists(filepath):
+        return None
+
+    h = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(64*1024), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class BuildManifest:
+    """ 
+    Records of the previous build outputs (content hashes, extracted resources, ...) 
+    used to skip unchanged files when rebuilding in the same build folder.
+    """
 
+    def __init__(self, filepath : str, configuration : Configuration):
 
-            targets = link_pattern.findall(href)
-            if not len(targets): 
-                continue # badly formated 'a' link
+        self.filepath = filepath
 
-            module_name = targets[0].lstrip('/').rstrip('/')
-            fixed_href = "powershell/module/%s/%s.html" % (module_name, module_name)
-            
-            if fixed_href != href:
-                logging.debug("link rewrite : %s -> %s " % ( href, fixed_href))
-                link['href'] = fixed_href
+        # any change in the script, the selected version or the html output mode invalidates the previous records
+        self.build_key = "%s:%s:%s" % (file_digest(os.path.realpath(__file__)), configuration.powershell_version, configuration.html_output)
+        self.records = {}
 
-        # Fix link to module.svg
-        module_svg_path = os.path.join(documents_dir, Configuration.domain, "en-us", "media", "toolbars", "module.svg")
-        images = content_table.findAll("img" , {'alt' : "Module"})
-        for image in images:
-            image['src'] =  os.path.relpath(module_svg_path, os.path.dirname(index_html_path))
-
-    # remove unsupported nav elements
-    nav_elements = [
-        ["nav"  , { "class" : "doc-outline", "role" : "navigation"}],
-        ["ul"   , { "class" : "breadcrumbs", "role" : "navigation"}],
-        ["div"  , { "class" : "sidebar", "role" : "navigation"}],
-        ["div"  , { "class" : "dropdown dropdown-full mobilenavi"}],
-        ["p"    , { "class" : "api-browser-description"}],
-        ["div"  , { "class" : "api-browser-search-field-container"}],
-        ["div"  , { "class" : "pageActions"}],
-        ["div"  , { "class" : "dropdown-container"}],
-        ["div"  , { "class" : "container footerContainer"}],
-        ["div"  , { "data-bi-name" : "header", "id" : "headerAreaHolder"}],
-        ["div"  , { "class" : "header-holder"}],
-        ["div"  , { "id" : "action-panel"}],
-        ["div"  , { "id" : "api-browser-search-field-container"}],
-    ]
-
-    for nav in nav_elements:
-        nav_class, nav_attr = nav
-        
-        for nav_tag in soup.findAll(nav_class, nav_attr):
-            _ = nav_tag.extract()
+        try:
+            with open(self.filepath, 'r', encoding="utf8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return
 
-    # remove script elems
-    for head_script in soup.head.findAll("script"):
-            _ = head_script.extract()
-    for body_async_script in soup.body.findAll("script", { "async" : "",  "defer" : ""}):
-            _ = head_script.extract()
+        if manifest.get('build_key') == self.build_key:
+            self.records = manifest['records']
 
-    # Fixing and downloading css stylesheets
-    theme_output_dir = os.path.join(documents_dir, Configuration.domain)
-    for link in soup.head.findAll("link", { "rel" : "stylesheet"}):
-        uri_path = link['href'].strip()
+    def get(self, stage : str, relpath : str):
+        return self.records.get(stage, {}).get(relpath)
 
-        if not uri_path.lstrip('/').startswith(Configuration.default_theme_uri):
-            continue
+    def unchanged_rewrite(self, relpath : str, src_digest : str, html_file : str):
+        """ return the previous rewrite record if neither its source, its output nor its links resolution changed since """
+        record = self.get("rewrite", relpath)
+        if not record or record['source'] != src_digest or not link_resolver.unchanged(record.get('links')):
+            return None
+        if record['output'] != file_digest(html_file):
+            return None
+        return record
 
-        # Construct (url, path) tuple
-        css_url = "https://%s/%s" % (Configuration.domain, uri_path)
-        css_filepath =  os.path.join(theme_output_dir, uri_path.lstrip('/'))
+    def page_symbols(self):
+        """ in-page symbols of every rewritten page """
+        return {relpath : record.get('symbols', []) for relpath, record in self.records.get("rewrite", {}).items()}
 
-        # Converting href to a relative link
-        path = os.path.relpath(css_filepath, os.path.dirname(index_html_path))
-        rel_uri = '/'.join(path.split(os.sep))
-        link['href'] = rel_uri
+    def unresolved_links(self):
+        """ links of the rewritten pages which did not resolve to a docset page, see LinkResolver """
+        return {
+            relpath : record['unresolved_links'] 
+            for relpath, record in self.records.get("rewrite", {}).items() if record.get('unresolved_links')
+        }
 
-        download_textfile(css_url, css_filepath)
+    def replace(self, stage : str, records : dict):
+        self.records[stage] = records
 
-    return soup
+    def save(self):
+        # an interrupted build must not leave a truncated manifest behind, see write_file_atomic
+        write_file_atomic(self.filepath, json.dumps({'build_key' : self.build_key, 'records' : self.records}), "w", encoding="utf8")
 
 
-def rewrite_html_contents(configuration : Configuration, html_root_dir : str):
-    """ rewrite every html file downloaded """
+class SharedOutputs:
+    """ 
+    Outputs shared between the builds of several powershell versions in the same process :
+    byte-identical source pages (e.g. the windows server modules) are only rewritten once,
+    and resources only downloaded once (see AssetStore). Reused files are hardlinked, see link_file.
+    """
 
-    additional_resources = set()
+    def __init__(self):
+        self.rewrites = {}
+        self.resources = {}
 
-    for html_file in glob.glob("%s/**/*.html" % html_root_dir, recursive = True):
+    def reuse_rewrite(self, relpath : str, src_digest : str, html_file : str):
+        """ 
+        link the same page rewritten by a previous build and return its rewrite record, if any.
+        Its links must resolve the same against the link table of this build (see LinkResolver.unchanged).
+        """
+        if not self.rewrites:
+            return None
 
-        logging.debug("rewrite  html_file : %s" % (html_file))
+        shared = self.rewrites.get((relpath, src_digest))
+        if not shared:
+            return None
 
-        # Read content and parse html
-        with open(html_file, 'r', encoding='utf8') as i_fd:
-            html_content = i_fd.read()
+        shared_html_file, record = shared
+        if not link_resolver.unchanged(record.get('links')):
+            return None
+        if file_digest(shared_html_file) != record['output']:
+            return None
 
-        soup = bs(html_content, 'html.parser')
-        
-        # rewrite html
-        soup, resources = rewrite_soup(configuration, soup, html_file, html_root_dir)
-        additional_resources = additional_resources.union(resources)
+        os.makedirs(os.path.dirname(html_file), exist_ok = True)
+        link_file(shared_html_file, html_file)
+        metrics.count("shared_rewrites")
+        return record
 
-        # Export fixed html
-        fixed_html = soup.prettify("utf-8")
-        with open(html_file, 'wb') as o_fd:
-            o_fd.write(fixed_html)
+    def add_rewrite(self, relpath : str, src_digest : str, html_file : str, record : dict):
+        self.rewrites[(relpath, src_digest)] = (html_file, record)
 
-    return additional_resources
+    def shared_resource(self, url : str):
+        """ (object path, referenced resources) of a resource downloaded by a previous build, if any """
+        shared = self.resources.get(url)
+        if not shared or not os.path.exists(shared[0]):
+            return None
+        return shared
 
+    def add_resource(self, url : str, object_path : str, references : set):
+        self.resources[url] = (object_path, references)
 
-def download_additional_resources(configuration : Configuration, documents_dir : str, resources_to_dl : set = set()):
-    """ Download optional resources for "beautification """
 
-    for resource in resources_to_dl:
-        
-        download_textfile(
-            resource.url, 
-            os.path.join(documents_dir, resource.path)
-        )
+class AssetStore:
+    """ 
+    Content addressed store of the external resources (stylesheets, images, fonts), kept in the build folder
+    across builds : every resource is downloaded once, and its content stored under objects/<sha256>.
+    The documents resources paths are hardlinks to these objects, so identical resources are only
+    stored once in the docset archive (as tar hardlinks) and unchanged resources are not rewritten.
+    Fonts and images referenced by stylesheets are fetched as well.
+    """
 
-    # Download index start page
-    index_url = Configuration.default_url % configuration.powershell_version
-    index_filepath = os.path.join(documents_dir, Configuration.domain, "en-us", "index.html")
+    css_url_pattern = re.compile(r"""url\(\s*(['"]?)([^'")]+)\1\s*\)""")
+
+    def __init__(self, configuration : Configuration, store_dir : str, documents_dir : str):
+
+        self.configuration = configuration
+        self.objects_dir = os.path.join(store_dir, "objects")
+        self.documents_dir = documents_dir
+        self.lock = threading.Lock()
+
+        # resource url -> object digest, for the current build
+        self.digests = {}
+        self.discovered = set()
+
+        os.makedirs(self.objects_dir, exist_ok = True)
+
+    def _rewrite_stylesheet(self, css_url : str, css_filepath : str, css : str):
+        """ make the stylesheet references relative, and return it along with the resources they point to """
+        references = set()
+
+        def fix_reference(match):
+            quote, reference = match.group(1), match.group(2).strip()
+            if reference.startswith("data:"):
+                return match.group(0)
+
+            parsed_reference = urllib.parse.urlparse(urllib.parse.urljoin(css_url, reference))
+            resource_url = urllib.parse.urlunparse(parsed_reference._replace(fragment = ""))
+            resource_filepath = local_resource_path(resource_url, self.documents_dir)
+            if not resource_filepath:
+                return match.group(0)
+
+            references.add(ThemeResourceRecord(
+                url = resource_url, 
+                path = os.path.relpath(resource_filepath, self.documents_dir),
+            ))
+
+            relative_path = '/'.join(os.path.relpath(resource_filepath, os.path.dirname(css_filepath)).split(os.sep))
+            if parsed_reference.fragment:
+                relative_path = "%s#%s" % (relative_path, parsed_reference.fragment)
+            return "url(%s%s%s)" % (quote, relative_path, quote)
+
+        return AssetStore.css_url_pattern.sub(fix_reference, css), references
+
+    def _link(self, object_path : str, resource_filepath : str):
+        os.makedirs(os.path.dirname(resource_filepath), exist_ok = True)
+        if not os.path.exists(resource_filepath) or not os.path.samefile(object_path, resource_filepath):
+            link_file(object_path, resource_filepath)
+
+    def _fetch(self, url : str, resource : ThemeResourceRecord):
+        resource_filepath = os.path.join(self.documents_dir, resource.path)
+
+        # already downloaded by the build of another version
+        shared_outputs = self.configuration.shared_outputs
+        shared = shared_outputs.shared_resource(url) if shared_outputs else None
+        if shared:
+            object_path, references = shared
+            self._link(object_path, resource_filepath)
+            with self.lock:
+                self.discovered.update(references)
+            metrics.count("shared_resources")
+            return
 
-    soup = bs( configuration.webdriver.get_url_page(index_url), 'html.parser')
-    soup = rewrite_index_soup(configuration, soup, index_filepath, documents_dir)
-    fixed_html = soup.prettify("utf-8")
-    with open(index_filepath, 'wb') as o_fd:
-            o_fd.write(fixed_html)
+        r = http_get(url)
+        if r.status_code != 200:
+            logging.warning("could not download resource %s (%d)" % (url, r.status_code))
+            return
 
+        content = r.content
+        references = set()
+        if resource.path.endswith(".css"):
+            css, references = self._rewrite_stylesheet(url, resource_filepath, r.text)
+            content = css.encode("utf8")
 
-    # Download module.svg icon for start page
-    icon_module_url  =     '/'.join(["https:/"   , Configuration.domain, "en-us", "media", "toolbars", "module.svg"])
-    icon_module_path = os.path.join(documents_dir, Configuration.domain, "en-us", "media", "toolbars", "module.svg")
-    download_binary(icon_module_url, icon_module_path)
+        digest = hashlib.sha256(content).hexdigest()
+        object_path = os.path.join(self.objects_dir, digest)
 
+        if os.path.exists(object_path):
+            metrics.count("assets_deduplicated")
+        else:
+            write_file_atomic(object_path, content)
+        self._link(object_path, resource_filepath)
 
-def create_sqlite_database(configuration, content_toc, resources_dir, documents_dir):
-    """ Indexing the html document in a format Dash can understand """
+        with self.lock:
+            self.digests[url] = digest
+            self.discovered.update(references)
 
-    def insert_into_sqlite_db(cursor, name, record_type, path):
-        """ Insert a new unique record in the sqlite database. """
-        try:
-            cursor.execute('SELECT rowid FROM searchIndex WHERE path = ?', (path,))
-            dbpath = cursor.fetchone()
-            cursor.execute('SELECT rowid FROM searchIndex WHERE name = ?', (name,))
-            dbname = cursor.fetchone()
-
-            if dbpath is None and dbname is None:
-                cursor.execute('INSERT OR IGNORE INTO searchIndex(name, type, path) VALUES (?,?,?)', (name, record_type, path))
-                logging.debug('DB add [%s] >> name: %s, path: %s' % (record_type, name, path))
-            else:
-                logging.debug('record exists')
+        if shared_outputs:
+            shared_outputs.add_resource(url, object_path, references)
 
-        except:
-            pass
+    def fetch(self, resources):
+        """ download every resource (and the ones they reference) concurrently on the download pool """
+        pending = set(resources)
+        fetched = set()
 
-    sqlite_filepath = os.path.join(resources_dir, "docSet.dsidx")
-    if os.path.exists(sqlite_filepath):
-        os.remove(sqlite_filepath)
+        while pending:
+            for resource in sorted(pending):
+                self.configuration.download_pool.submit(self._fetch, resource.url, resource)
+            self.configuration.download_pool.join()
 
-    db = sqlite3.connect(sqlite_filepath)
-    cur = db.cursor()
-    cur.execute('CREATE TABLE searchIndex(id INTEGER PRIMARY KEY, name TEXT, type TEXT, path TEXT);')
-    cur.execute('CREATE UNIQUE INDEX anchor ON searchIndex (name, type, path);')
+            fetched.update(pending)
+            with self.lock:
+                pending, self.discovered = self.discovered - fetched, set()
 
-    
-    for module_name, module in content_toc.items():
+    def prune(self):
+        """ remove the objects no longer used by the current build """
+        used_digests = set(self.digests.values())
+        for digest in os.listdir(self.objects_dir):
+            if digest not in used_digests:
+                os.remove(os.path.join(self.objects_dir, digest))
 
-        # path should be unix compliant
-        module_path = module['index'].replace(os.sep, '/')
-        insert_into_sqlite_db(cur, module_name, "Module", module_path)
 
-        for cmdlet in module['cmdlets']:
-            
-            cmdlet_name = cmdlet['name']
-            if cmdlet_name == module_name:
-                continue
+def link_file(src_path : str, dst_path : str):
+    """ 
+    Hardlink a file in another build stage folder, or copy it if hardlinks are not supported
+    (e.g. across filesystems). Safe since build files are only ever replaced, see write_file_atomic.
+    """
+    if os.path.lexists(dst_path):
+        # read only files can't be removed on Windows
+        if not os.access(dst_path, os.W_OK):
+            os.chmod(dst_path, stat.S_IWUSR)
+        os.remove(dst_path)
 
-            # path should be unix compliant
-            cmdlet_path = cmdlet['path'].replace(os.sep, '/')
+    try:
+        os.link(src_path, dst_path)
+    except OSError:
+        shutil.copy2(src_path, dst_path)
 
-            insert_into_sqlite_db(cur, cmdlet_name, "Command", cmdlet_path)
-        
 
-    # commit and close db
-    db.commit()
-    db.close()
+def sync_folder(src_folder : str, dst_folder : str, exclude_ext : tuple = ()):
+    """ 
+    Incrementally mirror a folder tree : only new or modified files are linked (see link_file)
+    and files no longer present in src_folder are removed.
+    Files ending with exclude_ext are left to the caller.
+    """
 
-def copy_folder(src_folder : str, dst_folder : str):
-    """ Copy a full folder tree anew every time """
+    def is_same_file(src_path, dst_path):
+        if not os.path.exists(dst_path):
+            return False
 
-    def onerror(func, path, exc_info):
-        """
-        Error handler for ``shutil.rmtree``.
+        if os.path.samefile(src_path, dst_path):
+            return True
 
-        If the error is due to an access error (read only file)
-        it attempts to add write permission and then retries.
+        src_stat, dst_stat = os.stat(src_path), os.stat(dst_path)
+        return src_stat.st_size == dst_stat.st_size and src_stat.st_mtime_ns == dst_stat.st_mtime_ns
 
-        If the error is for another reason it re-raises the error.
+    src_files = set()
+    for root, _, files in os.walk(src_folder):
+        for filename in files:
+            src_path = os.path.join(root, filename)
+            relpath = os.path.relpath(src_path, src_folder)
+            src_files.add(relpath)
 
-        Usage : ``shutil.rmtree(path, onerror=onerror)``
-        """
-        import stat
+            if filename.endswith(exclude_ext):
+                continue
 
-        if not os.path.exists(path):
-            return
+            dst_path = os.path.join(dst_folder, relpath)
+            if not is_same_file(src_path, dst_path):
+                os.makedirs(os.path.dirname(dst_path), exist_ok = True)
+                link_file(src_path, dst_path)
 
-        if not os.access(path, os.W_OK):
-            # Is the error an access error ?
-            os.chmod(path, stat.S_IWUSR)
-            func(path)
-        else:
-            raise
+    for root, _, files in os.walk(dst_folder):
+        for filename in files:
+            dst_path = os.path.join(root, filename)
+            if os.path.relpath(dst_path, dst_folder) in src_files:
+                continue
 
-    shutil.rmtree(dst_folder,ignore_errors=False,onerror=onerror) 
-    shutil.copytree(src_folder, dst_folder)
+            # read only files can't be removed on Windows
+            if not os.access(dst_path, os.W_OK):
+                os.chmod(dst_path, stat.S_IWUSR)
+            os.remove(dst_path)
 
 def merge_folders(src, dst):
     
@@ -600,7 +3176,7 @@ def merge_folders(src, dst):
                 os.path.join(dst, name)
             )
     else:
-        shutil.copyfile(src, dst)
+        link_file(src, dst)
 
 def main(configuration : Configuration):
 
@@ -615,6 +3191,9 @@ def main(configuration : Configuration):
     #                 'path' : relative path, 
     #             },
     #             ...
+    #         ],
+    #         'about' : [ # about_ topics, same format as cmdlets
+    #             ...
     #         ]
     #     },
     #     ...
@@ -622,59 +3201,132 @@ def main(configuration : Configuration):
     # """
     content_toc = {}
     resources_to_dl = set()
+    page_texts = {}
 
     """ 0. Prepare folders """
     download_dir = os.path.join(configuration.build_folder, "_1_downloaded_contents")
     win10_download_dir = os.path.join(os.getcwd(), "_win10_downloaded_contents")
+    if configuration.shard:
+        win10_download_dir = "%s_%s" % (win10_download_dir, configuration.shard_name)
     html_rewrite_dir = os.path.join(configuration.build_folder, "_2_html_rewrite")
     additional_resources_dir = os.path.join(configuration.build_folder, "_3_additional_resources")
     package_dir = os.path.join(configuration.build_folder, "_4_ready_to_be_packaged")
 
-    for folder in [download_dir, html_rewrite_dir, additional_resources_dir, package_dir]:
-        os.makedirs(folder, exist_ok=True)
-
     # _4_ready_to_be_packaged is the final build dir
     docset_dir = os.path.join(package_dir, "%s.docset" % Configuration.docset_name)
     content_dir = os.path.join(docset_dir , "Contents")
     resources_dir = os.path.join(content_dir, "Resources")
     document_dir = os.path.join(resources_dir, "Documents")
 
+    for folder in [download_dir, document_dir]:
+        os.makedirs(folder, exist_ok=True)
+
+    # stages 2 and 3 write through the final Documents folder, their snapshots are only kept on demand (debug)
+    for stage_dir in [html_rewrite_dir, additional_resources_dir]:
+        if not configuration.keep_stages and os.path.exists(stage_dir):
+            shutil.rmtree(stage_dir)
+
+    def snapshot_stage(stage_dir):
+        if configuration.keep_stages:
+            sync_folder(document_dir, stage_dir)
+
+    manifest = BuildManifest(os.path.join(configuration.build_folder, "manifest.json"), configuration)
+
     """ 1. Download html pages """
     logging.info("[1] scraping web contents")
-    content_toc = crawl_posh_contents(configuration, configuration.docs_toc_url, download_dir)
+    metrics.start_stage("[1] download")
+    configuration.crawl_journal = CrawlJournal(os.path.join(configuration.build_folder, "crawl_journal.jsonl"), configuration.resume)
+    modules = download_modules_toc(configuration, configuration.docs_toc_url)
+    content_toc = crawl_posh_contents(configuration, modules, download_dir, download = False)
 
     # do not download twice the win10 api since it's quite a handful
-    if os.path.exists(os.path.join(win10_download_dir, "toc.json")):
+    windows_toc_cached = os.path.exists(os.path.join(win10_download_dir, "toc.json"))
+    if windows_toc_cached:
         with open(os.path.join(win10_download_dir, "toc.json"), "r") as content:
             windows_toc = json.load(content)
     else:
-        windows_toc = crawl_posh_contents(configuration, configuration.windows_toc_url, win10_download_dir)
-        with open(os.path.join(win10_download_dir, "toc.json"), "w") as content:
-                json.dump(windows_toc, content)
+        windows_modules = download_modules_toc(configuration, configuration.windows_toc_url)
+        windows_toc = crawl_posh_contents(configuration, windows_modules, win10_download_dir, download = False)
+
+    # pages links are resolved against the merged toc (see LinkResolver), known before any page is downloaded
+    merged_toc = dict(content_toc)
+    merged_toc.update(windows_toc)
+    set_link_resolver(LinkResolver(merged_toc))
+
+    # streaming mode : stages 1, 2 and 4 are run concurrently
+    pipeline = None
+    if configuration.stream:
+        pipeline = StreamingPipeline(configuration, document_dir, resources_dir, manifest)
+        configuration.page_sink = pipeline
+
+    crawl_posh_contents(configuration, modules, download_dir)
+    if not windows_toc_cached:
+        crawl_posh_contents(configuration, windows_modules, win10_download_dir)
+    elif pipeline:
+        pipeline.schedule_toc(configuration.shard_toc(windows_toc), win10_download_dir)
+
+    # the modules of the other shards are only known for their links
+    content_toc = configuration.shard_toc(content_toc)
+
+    configuration.download_pool.join()
+    if not windows_toc_cached:
+        os.makedirs(win10_download_dir, exist_ok = True)
+        write_file_atomic(os.path.join(win10_download_dir, "toc.json"), json.dumps(windows_toc), "w")
         
+    configuration.crawl_journal.close()
+    configuration.crawl_journal = None
+
     # Merge win10 api content
     merge_folders(win10_download_dir, download_dir)
-    content_toc.update(windows_toc)
-    with open(os.path.join(download_dir, "toc.json"), "w") as content:
-        json.dump(content_toc, content)
+    content_toc.update(configuration.shard_toc(windows_toc))
+    write_file_atomic(os.path.join(download_dir, "toc.json"), json.dumps(content_toc), "w")
 
     """ 2.  Parse and rewrite html contents """
     logging.info("[2] rewriting urls and hrefs")
-    copy_folder(download_dir, html_rewrite_dir)
-    resources_to_dl = rewrite_html_contents(configuration, html_rewrite_dir)
+    metrics.start_stage("[2] rewrite")
+    if pipeline:
+        resources_to_dl = pipeline.close()
+        configuration.page_sink = None
+        sync_folder(download_dir, document_dir, exclude_ext = (".html",))
+    else:
+        sync_folder(download_dir, document_dir, exclude_ext = (".html",))
+        resources_to_dl = rewrite_html_contents(configuration, download_dir, document_dir, manifest, page_texts)
+    manifest.save()
+    report_unresolved_links(manifest.unresolved_links())
+    snapshot_stage(html_rewrite_dir)
 
     """ 3.  Download additionnal resources """
     logging.info("[3] download style contents")
-    copy_folder(html_rewrite_dir, additional_resources_dir )
-    download_additional_resources(configuration, additional_resources_dir, resources_to_dl)
+    metrics.start_stage("[3] additional resources")
+    download_additional_resources(configuration, document_dir, content_toc, resources_to_dl)
+    snapshot_stage(additional_resources_dir)
 
     """ 4.  Database indexing """
     logging.info("[4] indexing to database")
-    copy_folder(additional_resources_dir, document_dir )
-    create_sqlite_database(configuration, content_toc, resources_dir, document_dir)
+    metrics.start_stage("[4] index")
+    if not pipeline:
+        create_sqlite_database(configuration, content_toc, resources_dir, document_dir, manifest.page_symbols(), page_texts)
 
     """ 5.  Archive packaging """
-    src_dir = os.path.dirname(__file__)
+    if configuration.shard:
+        logging.info("[5] exporting %s" % configuration.shard_name)
+        metrics.start_stage("[5] shard export")
+        stylesheets = sorted(r for r in resources_to_dl if r.path.endswith(".css"))
+        export_shard(configuration, docset_dir, content_toc, list(merged_toc), stylesheets)
+    else:
+        logging.info("[5] packaging as a dash docset")
+        metrics.start_stage("[5] packaging")
+        package_docset(configuration, docset_dir)
+
+    metrics.stop_stage()
+
+
+def package_docset(configuration : Configuration, docset_dir : str):
+    """ add the docset static files (plist, license and icons) and package it in configuration.output_filepath """
+    content_dir = os.path.join(docset_dir, "Contents")
+    resources_dir = os.path.join(content_dir, "Resources")
+
+    src_dir = os.path.dirname(os.path.realpath(__file__))
     shutil.copy(os.path.join(src_dir, "static/Info.plist"), content_dir)
     shutil.copy(os.path.join(src_dir, "static/DASH_LICENSE"), os.path.join(resources_dir, "LICENSE"))
     shutil.copy(os.path.join(src_dir, "static/icon.png"), docset_dir)
@@ -683,13 +3335,594 @@ def main(configuration : Configuration):
     output_dir = os.path.dirname(configuration.output_filepath)
     os.makedirs(output_dir, exist_ok=True)
 
-    logging.info("[5] packaging as a dash docset")
     make_docset(
         docset_dir,
         configuration.output_filepath,
-        Configuration.docset_name
+        configuration.compression_level,
+        configuration.jobs,
+        archive_index_filepath(configuration.output_filepath) if configuration.archive_index else None
     )
 
+def shard_folder(output_filepath : str, shard : tuple):
+    """ export folder of a shard (see --shard) : shards/<index>-of-<count>/ next to the docset archive """
+    return os.path.join(os.path.dirname(output_filepath), "shards", "%d-of-%d" % shard)
+
+def export_shard(configuration : Configuration, docset_dir : str, content_toc : dict, modules : list, stylesheets : list):
+    """ 
+    Export a shard docset folder (documents and index database) for merge_shards, along with a shard.json
+    description : its content toc, the modules of every shard in toc order, the index start page stylesheets 
+    and the settings all the shards must share. shard.json is written last, so that an interrupted export is never merged.
+    """
+    shard_dir = shard_folder(configuration.output_filepath, configuration.shard)
+    shard_filepath = os.path.join(shard_dir, "shard.json")
+    if os.path.exists(shard_filepath):
+        os.remove(shard_filepath)
+
+    sync_folder(docset_dir, os.path.join(shard_dir, os.path.basename(docset_dir)))
+
+    shard = {
+        'shard' : list(configuration.shard),
+        'version' : configuration.powershell_version,
+        'settings' : {
+            'html_output' : configuration.html_output,
+            'index_page' : configuration.index_page,
+            'full_text' : configuration.full_text,
+            'link_table' : link_resolver.digest,
+        },
+        'content_toc' : content_toc,
+        'modules' : modules,
+        'stylesheets' : [list(r) for r in stylesheets],
+    }
+    write_file_atomic(shard_filepath, json.dumps(shard), "w", encoding = "utf8")
+
+def merge_shard_documents(shard_dirs : list, documents_dir : str, skipped : set = set()):
+    """ 
+    Join the documents trees of the shards into documents_dir. Identical files, like the shared theme resources,
+    are only stored once (hardlinked, see make_docset). Conflicting files are reported, the first shard one is kept.
+    Return the number of conflicts.
+    """
+    origins = {} # relpath -> (shard dir, digest)
+    objects = {} # digest -> merged file
+    conflicts = 0
+
+    for shard_dir in shard_dirs:
+        shard_documents_dir = os.path.join(shard_dir, "%s.docset" % Configuration.docset_name, "Contents", "Resources", "Documents")
+
+        for root, dirs, files in os.walk(shard_documents_dir):
+            dirs.sort()
+            for filename in sorted(files):
+                src_path = os.path.join(root, filename)
+                relpath = os.path.relpath(src_path, shard_documents_dir)
+                if relpath in skipped:
+                    continue
+
+                digest = file_digest(src_path)
+                if relpath in origins:
+                    if origins[relpath][1] != digest:
+                        logging.warning("shards conflict : %s differs between %s and %s" % (relpath, origins[relpath][0], shard_dir))
+                        conflicts += 1
+                    continue
+
+                origins[relpath] = (shard_dir, digest)
+                dst_path = os.path.join(documents_dir, relpath)
+                os.makedirs(os.path.dirname(dst_path), exist_ok = True)
+                if digest in objects:
+                    metrics.count("merged_duplicates")
+                link_file(objects.setdefault(digest, src_path), dst_path)
+
+    return conflicts
+
+def merge_shard_indexes(configuration : Configuration, shard_dirs : list, content_toc : dict, resources_dir : str, documents_dir : str):
+    """ 
+    index the merged content toc, along with the in-page symbols and pages text of the shards indexes :
+    records are added in toc order, so that duplicates are resolved like in a single build (see SqliteIndexBuilder)
+    """
+    page_symbols = {}
+    page_texts = {}
+
+    for shard_dir in shard_dirs:
+        shard_sqlite_filepath = os.path.join(shard_dir, "%s.docset" % Configuration.docset_name, "Contents", "Resources", "docSet.dsidx")
+        db = sqlite3.connect(shard_sqlite_filepath)
+        try:
+            for name, record_type, path in db.execute('SELECT name, type, path FROM searchIndex ORDER BY id'):
+                page_path, _, anchor = path.partition("#")
+                if anchor:
+                    page_symbols.setdefault(page_path, []).append((name, record_type, anchor))
+
+            if configuration.full_text:
+                for title, body, path in db.execute('SELECT title, body, path FROM pageText'):
+                    page_texts[path] = (title, body)
+                    page_symbols.setdefault(path, [])
+        finally:
+            db.close()
+
+    create_sqlite_database(configuration, content_toc, resources_dir, documents_dir, page_symbols, page_texts)
+
+def merge_shards(configuration : Configuration, shard_count : int):
+    """ merge the shards exported by --shard 1/N ... N/N builds into a single docset, packaged in configuration.output_filepath """
+
+    shard_dirs = []
+    shards = []
+    for shard_index in range(1, shard_count + 1):
+        shard_dir = shard_folder(configuration.output_filepath, (shard_index, shard_count))
+        try:
+            with open(os.path.join(shard_dir, "shard.json"), 'r', encoding="utf8") as f:
+                shards.append(json.load(f))
+        except OSError:
+            raise RuntimeError("shard %d/%d is missing or incomplete (%s)" % (shard_index, shard_count, shard_dir))
+        shard_dirs.append(shard_dir)
+
+    # shards built against different tocs, versions or settings can not be merged
+    for shard_dir, shard in zip(shard_dirs[1:], shards[1:]):
+        if shard['version'] != shards[0]['version'] or shard['settings'] != shards[0]['settings']:
+            raise RuntimeError("shard %s was not built like %s : %s" % (shard_dir, shard_dirs[0], shard['settings']))
+
+    settings = shards[0]['settings']
+    configuration.html_output = settings['html_output']
+    configuration.full_text = configuration.full_text and settings['full_text']
+
+    docset_dir = os.path.join(configuration.build_folder, "_4_ready_to_be_packaged", "%s.docset" % Configuration.docset_name)
+    resources_dir = os.path.join(docset_dir, "Contents", "Resources")
+    documents_dir = os.path.join(resources_dir, "Documents")
+    if os.path.exists(docset_dir):
+        shutil.rmtree(docset_dir)
+    os.makedirs(documents_dir)
+
+    # modules are merged in toc order, and must only be built by a single shard
+    shards_toc = {}
+    stylesheets = set()
+    conflicts = 0
+    for shard_dir, shard in zip(shard_dirs, shards):
+        for module_name, module in shard['content_toc'].items():
+            if module_name in shards_toc:
+                logging.warning("shards conflict : module %s is built by several shards (%s)" % (module_name, shard_dir))
+                conflicts += 1
+                continue
+            shards_toc[module_name] = module
+        stylesheets.update(ThemeResourceRecord(*r) for r in shard['stylesheets'])
+
+    content_toc = {name : shards_toc[name] for name in shards[0]['modules'] if name in shards_toc}
+    content_toc.update(shards_toc)
+
+    logging.info("[1] merging %d shards documents" % shard_count)
+    metrics.start_stage("[1] merge documents")
+
+    # the content toc and start page list the modules of every shard
+    index_filepath = os.path.join(documents_dir, Configuration.domain, "en-us", "index.html")
+    toc_filepath = os.path.join(documents_dir, "toc.json")
+    skipped = {"toc.json"}
+    if settings['index_page'] == "toc":
+        skipped.add(os.path.relpath(index_filepath, documents_dir))
+
+    conflicts += merge_shard_documents(shard_dirs, documents_dir, skipped)
+    write_file_atomic(toc_filepath, json.dumps(content_toc), "w")
+
+    if settings['index_page'] == "toc":
+        soup = render_index_soup(configuration, content_toc, index_filepath, documents_dir, sorted(stylesheets))
+        write_file_atomic(index_filepath, serialize_soup(configuration, soup))
+
+    logging.info("[2] merging %d shards indexes" % shard_count)
+    metrics.start_stage("[2] merge index")
+    merge_shard_indexes(configuration, shard_dirs, content_toc, resources_dir, documents_dir)
+    metrics.count("shard_conflicts", conflicts)
+    if conflicts:
+        logging.warning("%d conflicts between shards, see the warnings above" % conflicts)
+
+    logging.info("[3] packaging as a dash docset")
+    metrics.start_stage("[3] packaging")
+    package_docset(configuration, docset_dir)
+    metrics.stop_stage()
+
+
+def version_key(version : str):
+    return tuple(int(n) for n in version.split("."))
+
+def version_output_filepath(args, version : str):
+    """ docset archive path of a version : --output when building a single one, versions/<version>/ otherwise """
+    output_filepath = os.path.realpath(args.output)
+    if len(args.version) == 1:
+        return output_filepath
+
+    output_dir, output_filename = os.path.split(output_filepath)
+    return os.path.join(output_dir, "versions", version, output_filename)
+
+def build_versions(args, posh_webdriver, versions : list = None, download_pool = None, async_client = None):
+    """ 
+    Build the docsets of every selected version (or only the given versions), sharing the downloads and rewrites 
+    of identical pages. The download pool and http client may also be shared with other builds (see DocsetWatcher).
+    Return the successfully built versions along with their archive path.
+    """
+
+    versions = versions or args.version
+    shared_outputs = SharedOutputs() if len(versions) > 1 else None
+    rate_limiter.reset_retries()
+    built_versions = collections.OrderedDict()
+
+    for version in versions:
+        version_args = argparse.Namespace(**vars(args))
+        version_args.version = version
+        version_args.output = version_output_filepath(args, version)
+
+        if len(args.version) > 1:
+            logging.info("[+] building powershell %s docset" % version)
+            metrics.stage_prefix = "%s " % version
+
+        conf = Configuration( version_args, posh_webdriver, shared_outputs, download_pool, async_client )
+        try:
+            build = main
+            if args.merge_shards:
+                build = lambda conf: merge_shards(conf, args.merge_shards)
+
+            if args.temporary:
+
+                with tempfile.TemporaryDirectory() as tmp_builddir:
+                    conf.build_folder = tmp_builddir
+                    build(conf)
+            else:
+                build(conf)
+        except Exception:
+            if len(args.version) == 1:
+                raise
+            logging.exception("powershell %s docset build failed" % version)
+            continue
+        finally:
+            conf.close()
+
+        built_versions[version] = conf.output_filepath
+
+    metrics.stage_prefix = ""
+    return built_versions
+
+def publish_docsets(args, built_versions : dict):
+    """ 
+    Copy the latest built version to --output (along with its offset index) when building several versions, 
+    and write the docset.json feed. Archives are swapped in atomically, so that they can be served meanwhile.
+    """
+    output_filepath = os.path.realpath(args.output)
+
+    # the latest version is also the default archive of a multi-versions feed
+    if len(args.version) > 1 and built_versions:
+        latest_version = max(built_versions, key = version_key)
+        latest_filepaths = [(built_versions[latest_version], output_filepath)]
+        if args.archive_index:
+            latest_filepaths.append((archive_index_filepath(built_versions[latest_version]), archive_index_filepath(output_filepath)))
+
+        for src_filepath, dst_filepath in latest_filepaths:
+            with open(src_filepath, "rb") as src:
+                write_file_atomic(dst_filepath, iter(lambda: src.read(1024*1024), b""))
+
+    docset_json = args.docset_json
+    if not docset_json and len(args.version) > 1:
+        docset_json = os.path.join(os.path.dirname(output_filepath), "docset.json")
+    if docset_json and built_versions:
+        write_docset_json(os.path.realpath(docset_json), output_filepath, built_versions, args.docset_version)
+
+def write_docset_json(filepath : str, archive_filepath : str, built_versions : dict, docset_version : str = None):
+    """ 
+    Write the dash feed docset.json of the built versions, archive_filepath being the default (latest) one.
+    Archives paths are relative to the docset.json folder.
+    """
+    feed_dir = os.path.dirname(filepath)
+    latest_version = max(built_versions, key = version_key)
+    date = time.strftime("%y-%m-%d", time.gmtime())
+
+    docset = {
+        'name' : Configuration.docset_name,
+        'version' : "%s/%s" % ((docset_version or latest_version).lstrip("v"), date),
+        'archive' : os.path.relpath(archive_filepath, feed_dir).replace(os.sep, "/"),
+        'author' : {
+            'name' : "lucasg",
+            'link' : "https://github.com/lucasg",
+        },
+        'aliases' : [
+            "Windows shell",
+            "posh",
+            "Cmdlets",
+            "Windows automation",
+        ],
+        'specific_versions' : [
+            {
+                'version' : version,
+                'archive' : os.path.relpath(built_versions[version], feed_dir).replace(os.sep, "/"),
+            }
+            for version in sorted(built_versions, key = version_key, reverse = True)
+        ],
+    }
+
+    write_file_atomic(filepath, json.dumps(docset, indent = 4), "w", encoding = "utf8")
+
+
+class DocsetWatcher:
+    """ 
+    Daemon mode (--watch) : poll the upstream tables of contents on a schedule, and rebuild the versions whose toc 
+    changed since their last build. The webdriver pool, download workers and http clients are kept warm between builds,
+    unchanged pages being revalidated through the http cache and skipped by the build manifest.
+    The daemon state (last build, queue depth) is served as json on a local status endpoint (--status-port).
+    """
+
+    def __init__(self, args, posh_webdriver):
+
+        self.args = args
+        self.posh_webdriver = posh_webdriver
+        self.interval = max(1, args.watch)
+        self.stopped = threading.Event()
+
+        # warm build resources, shared by every build
+        self.download_pool = DownloadPool(args.jobs, args.max_host_connections)
+        self.http_client = None
+        if args.http_backend == "httpx" and httpx is not None:
+            self.http_client = AsyncHttpClient(self.download_pool.max_host_connections, http2 = not args.no_http2)
+
+        # polled toc urls : docs toc of every version, and the windows toc shared by all of them
+        self.toc_urls = {version : Configuration.docs_toc_url_for(version) for version in args.version}
+        self.toc_validators = {}    # url -> conditional request headers
+        self.polled_digests = {}    # url -> digest of the last polled toc
+        self.built_digests = {}     # url -> digest of the toc last built successfully
+        self.built_versions = collections.OrderedDict()
+
+        # tocs are polled from the recorded fixtures in replay mode
+        self.replay_server = None
+        if args.replay:
+            self.replay_server = ReplayServer(FixtureStore(os.path.realpath(args.replay)), args.replay_scale)
+
+        self.lock = threading.Lock()
+        self.status = {
+            'state' : "idle",
+            'started' : DocsetWatcher.timestamp(time.time()),
+            'polls' : 0,
+            'last_poll' : None,
+            'next_poll' : None,
+            'builds' : 0,
+            'last_build' : None,
+            'last_success' : None,
+            'queued_versions' : [],
+            'published' : {},
+        }
+
+        self.status_server = None
+        if args.status_port is not None:
+            self.status_server = self._serve_status(args.status_port)
+
+    @staticmethod
+    def timestamp(t : float):
+        return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(t))
+
+    def _serve_status(self, port : int):
+        watcher = self
+        class StatusRequestHandler(http.server.BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                if urllib.parse.urlparse(self.path).path not in ("/", "/status"):
+                    self.send_error(404)
+                    return
+
+                body = json.dumps(watcher.get_status(), indent = 2).encode("utf8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logging.debug("status server : %s" % (format % args))
+
+        server = ThreadingHTTPServer(("127.0.0.1", port), StatusRequestHandler)
+        threading.Thread(target = server.serve_forever, daemon = True).start()
+        logging.info("[watch] status served on http://127.0.0.1:%d/status" % server.server_address[1])
+        return server
+
+    def get_status(self):
+        """ daemon state, along with the current queue depth : versions waiting to be built and pending downloads """
+        with self.lock:
+            status = dict(self.status)
+
+        pending_downloads = self.download_pool.queue_depth()
+        status['queue'] = {
+            'versions' : len(status['queued_versions']),
+            'downloads' : pending_downloads,
+        }
+        status['queue_depth'] = len(status['queued_versions']) + pending_downloads
+        return status
+
+    def _update_status(self, **status):
+        with self.lock:
+            self.status.update(status)
+
+    def _toc_digest(self, url : str):
+        """ digest of an upstream toc, revalidated with a conditional request against the last polled one """
+        headers = dict(self.toc_validators.get(url, {})) if url in self.polled_digests else {}
+
+        poll_url = self.replay_server.local_url(url) if self.replay_server else url
+        r = session.get(poll_url, headers = headers, timeout = 60)
+        if r.status_code == 304:
+            return self.polled_digests[url]
+        r.raise_for_status()
+
+        validators = {}
+        if r.headers.get("ETag"):
+            validators["If-None-Match"] = r.headers["ETag"]
+        if r.headers.get("Last-Modified"):
+            validators["If-Modified-Since"] = r.headers["Last-Modified"]
+        self.toc_validators[url] = validators
+
+        return hashlib.sha256(r.content).hexdigest()
+
+    def poll(self):
+        """ versions whose docs toc, or the windows toc, changed since their last successful build """
+        self._update_status(state = "polling")
+        for url in list(self.toc_urls.values()) + [Configuration.windows_toc_url]:
+            self.polled_digests[url] = self._toc_digest(url)
+
+        windows_url = Configuration.windows_toc_url
+        windows_changed = self.polled_digests[windows_url] != self.built_digests.get(windows_url)
+
+        # the win10 downloaded contents are otherwise reused as is by the builds, see main
+        if windows_changed and windows_url in self.built_digests:
+            logging.info("[watch] windows modules toc changed")
+            windows_toc_filepath = os.path.join(os.getcwd(), "_win10_downloaded_contents", "toc.json")
+            if os.path.exists(windows_toc_filepath):
+                os.remove(windows_toc_filepath)
+
+        return [
+            version for version, url in self.toc_urls.items() 
+            if windows_changed or self.polled_digests[url] != self.built_digests.get(url)
+        ]
+
+    def build(self, versions : list):
+        """ rebuild the given versions, and publish every version built so far """
+        global metrics
+        metrics = BuildMetrics()
+
+        logging.info("[watch] building powershell %s docsets" % ", ".join(versions))
+        self._update_status(state = "building", queued_versions = list(versions))
+        start = time.time()
+
+        built_versions = {}
+        error = None
+        try:
+            built_versions = build_versions(self.args, self.posh_webdriver, versions, self.download_pool, self.http_client)
+            self.built_versions.update(built_versions)
+            publish_docsets(self.args, self.built_versions)
+        except Exception as e:
+            logging.exception("[watch] build failed")
+            error = str(e)
+
+        for version in built_versions:
+            url = self.toc_urls[version]
+            self.built_digests[url] = self.polled_digests[url]
+        if not error and len(built_versions) == len(versions):
+            self.built_digests[Configuration.windows_toc_url] = self.polled_digests[Configuration.windows_toc_url]
+
+        metrics.log_summary()
+        if self.args.metrics:
+            metrics.save(os.path.realpath(self.args.metrics))
+
+        end = time.time()
+        with self.lock:
+            self.status['builds'] += 1
+            self.status['queued_versions'] = []
+            self.status['last_build'] = {
+                'time' : DocsetWatcher.timestamp(end),
+                'duration' : end - start,
+                'versions' : versions,
+                'failed' : [version for version in versions if version not in built_versions],
+                'error' : error,
+            }
+            if built_versions:
+                self.status['last_success'] = DocsetWatcher.timestamp(end)
+            self.status['published'] = dict(self.built_versions)
+
+    def run(self):
+        """ poll and rebuild until stopped (SIGTERM or Ctrl-C) """
+        logging.info("[watch] polling upstream tables of contents every %ds" % self.interval)
+        while not self.stopped.is_set():
+            try:
+                versions = self.poll()
+            except Exception as e:
+                logging.warning("[watch] cannot poll upstream tables of contents : %s" % e)
+                versions = []
+
+            now = time.time()
+            with self.lock:
+                self.status['polls'] += 1
+                self.status['last_poll'] = DocsetWatcher.timestamp(now)
+
+            if versions:
+                self.build(versions)
+            else:
+                logging.debug("[watch] no upstream changes")
+
+            next_poll = now + self.interval
+            self._update_status(state = "idle", next_poll = DocsetWatcher.timestamp(next_poll))
+            self.stopped.wait(max(0, next_poll - time.time()))
+
+    def stop(self):
+        self.stopped.set()
+
+    def close(self):
+        if self.status_server:
+            self.status_server.shutdown()
+            self.status_server.server_close()
+        if self.replay_server:
+            self.replay_server.shutdown()
+        if self.http_client:
+            self.http_client.close()
+        self.download_pool.shutdown()
+
+
+def shard_spec(value : str):
+    """ argparse type of --shard : "K/N" -> (K, N) """
+    try:
+        shard_index, shard_count = (int(n) for n in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError("invalid shard %r, expected K/N" % value)
+
+    if not 1 <= shard_index <= shard_count:
+        raise argparse.ArgumentTypeError("invalid shard %r, K must be between 1 and N" % value)
+    return (shard_index, shard_count)
+
+
+# default of --benchmark-floor : stage slowdowns under this duration (in seconds) are considered as noise
+benchmark_noise_floor = 0.5
+
+def run_benchmark(args):
+    """ time every build stage of replayed builds, for each synthetic corpus scale in args.benchmark """
+    global metrics
+
+    results = collections.OrderedDict()
+    cwd = os.getcwd()
+
+    for scale in args.benchmark:
+        logging.info("[benchmark] replaying build at scale %dx" % scale)
+        metrics = BuildMetrics()
+
+        # every build starts from scratch : no http cache, build folder nor win10 downloaded contents
+        with tempfile.TemporaryDirectory() as bench_dir:
+            bench_args = argparse.Namespace(**vars(args))
+            bench_args.replay = os.path.realpath(args.replay)
+            bench_args.replay_scale = scale
+            bench_args.version = max(args.version, key = version_key)
+            bench_args.output = os.path.join(bench_dir, "Powershell.tgz")
+            bench_args.no_cache = True
+
+            os.chdir(bench_dir)
+            try:
+                conf = Configuration(bench_args)
+                try:
+                    main(conf)
+                finally:
+                    conf.close()
+            finally:
+                os.chdir(cwd)
+
+        report = metrics.report()
+        results[str(scale)] = {
+            'stages' : report['stages'],
+            'downloads' : report['downloads']['count'],
+            'rewrites' : report['rewrites']['count'],
+            'index' : report['index'],
+        }
+
+    return {'scales' : results}
+
+def benchmark_regressions(results : dict, baseline : dict, tolerance : float, floor : float = benchmark_noise_floor):
+    """ stages slower than their baseline wall time by more than tolerance (ratio) and floor (seconds) """
+    regressions = []
+
+    for scale, result in results['scales'].items():
+        baseline_stages = baseline['scales'].get(scale, {}).get('stages', {})
+
+        for name, stage in result['stages'].items():
+            if name not in baseline_stages:
+                continue
+
+            wall_time = stage['wall_time']
+            baseline_time = baseline_stages[name]['wall_time']
+            if wall_time > baseline_time * (1 + tolerance) and wall_time - baseline_time > floor:
+                regressions.append("%sx %s : %.2fs -> %.2fs" % (scale, name, baseline_time, wall_time))
+
+    return regressions
+
 
 if __name__ == '__main__':
 
@@ -705,8 +3938,9 @@ if __name__ == '__main__':
     )
 
     parser.add_argument("-v", "--version", 
-        help="select powershell API versions", 
-        default = "7.1",
+        help="select powershell API versions, several versions are built in the same run", 
+        default = ["7.1"],
+        nargs='+',
         choices = [
             "5.1", 
             "7.0",  # LTS
@@ -714,6 +3948,16 @@ if __name__ == '__main__':
         ]
     )
 
+    parser.add_argument("--docset-json", 
+        help="write the dash feed docset.json of the built versions (default : next to --output when building several versions)", 
+        default = None,
+    )
+
+    parser.add_argument("--docset-version", 
+        help="docset version written in docset.json (default : the latest powershell version built)", 
+        default = None,
+    )
+
     parser.add_argument("-t", "--temporary", 
         help="Use a temporary directory for creating docset, otherwise use current dir.", 
         default=False, 
@@ -744,6 +3988,223 @@ if __name__ == '__main__':
         nargs='+'
     )
 
+    parser.add_argument("-j", "--jobs", 
+        help="number of concurrent downloads and html rewriting processes", 
+        default = 1,
+        type=int,
+    )
+
+    parser.add_argument("--max-host-connections", 
+        help="cap on concurrent connections to a single host (default : --jobs)", 
+        default = None,
+        type=int,
+    )
+
+    parser.add_argument("--http-backend", 
+        help="http client : blocking requests session (default) or asyncio httpx client, with HTTP/2 multiplexing if h2 is installed", 
+        default = "requests",
+        choices = [
+            "requests",
+            "httpx",
+        ]
+    )
+
+    parser.add_argument("--no-http2", 
+        help="only use HTTP/1.1 keep-alive connections with the httpx backend", 
+        default=False, 
+        action="store_true"
+    )
+
+    parser.add_argument("--max-rate", 
+        help="maximum requests per second sent upstream, lowered automatically when throttled (0 : unlimited)", 
+        default = 20,
+        type=float,
+    )
+
+    parser.add_argument("--max-retries", 
+        help="maximum number of failed or throttled requests retried during a build (all the selected versions, or a --watch cycle)", 
+        default = 200,
+        type=int,
+    )
+
+    parser.add_argument("--html-output", 
+        help="html pages serialization : indented (pretty) or minified (whitespace collapsed, comments and empty attributes stripped)", 
+        default = "pretty",
+        choices = [
+            "pretty",
+            "minified",
+        ]
+    )
+
+    parser.add_argument("--compression-level", 
+        help="gzip compression level of the docset archive, from 0 (none) to 9 (best, default)", 
+        default = 9,
+        type=int,
+        choices = range(10),
+        metavar = "{0-9}",
+    )
+
+    parser.add_argument("--archive-index", 
+        help="compress the docset archive in independent blocks, and write a tarix-style offset index next to it (<output>.tarix) for random access", 
+        default=False, 
+        action="store_true"
+    )
+
+    parser.add_argument("--archive-latency", 
+        help="time random-access reads of the --output archive members through its index, against a full extraction, instead of building", 
+        default=False, 
+        action="store_true"
+    )
+
+    parser.add_argument("--resume", 
+        help="resume an interrupted crawl : pages recorded in the checkpoint journal of the build folder are not downloaded again", 
+        default=False, 
+        action="store_true"
+    )
+
+    parser.add_argument("--shard", 
+        help="build only the modules of shard K out of N (e.g. 2/4), exported next to --output for --merge-shards", 
+        default = None,
+        type = shard_spec,
+        metavar = "K/N",
+    )
+
+    parser.add_argument("--merge-shards", 
+        help="merge the N shards built next to --output (by --shard 1/N ... N/N) into a single docset", 
+        default = None,
+        type = int,
+        metavar = "N",
+    )
+
+    parser.add_argument("--watch", 
+        help="daemon mode : poll the upstream tables of contents every SECONDS, and rebuild the docsets when they change", 
+        default = None,
+        type=float,
+        metavar = "SECONDS",
+    )
+
+    parser.add_argument("--status-port", 
+        help="serve the --watch daemon status (last build, queue depth) as json on http://127.0.0.1:PORT/status", 
+        default = None,
+        type=int,
+        metavar = "PORT",
+    )
+
+    parser.add_argument("--stream", 
+        help="rewrite and index pages as soon as they are downloaded", 
+        default=False, 
+        action="store_true"
+    )
+
+    parser.add_argument("--keep-stages", 
+        help="keep a (hardlinked) copy of every intermediate build stage folder, for debugging purposes", 
+        default=False, 
+        action="store_true"
+    )
+
+    parser.add_argument("--index-page", 
+        help="build the index start page from the modules toc, download it, or render it in a (headless) browser", 
+        default = "toc",
+        choices = [
+            "toc",
+            "static",
+            "browser",
+        ]
+    )
+
+    parser.add_argument("--full-text", 
+        help="index the text of every page in a full-text search table of the docset database (sqlite FTS5)", 
+        default=False, 
+        action="store_true"
+    )
+
+    parser.add_argument("--search", 
+        help="search the full-text index of a docset built with --full-text, instead of building one", 
+        default = None,
+    )
+
+    parser.add_argument("--search-index", 
+        help="docset database (docSet.dsidx) or .docset folder searched by --search (default : the latest version build folder)", 
+        default = None,
+    )
+
+    parser.add_argument("--parser", 
+        help="html parser backend (lxml and html5lib must be installed separately)", 
+        default = "html.parser",
+        choices = [
+            "html.parser",
+            "lxml",
+            "html5lib",
+        ]
+    )
+
+    parser.add_argument("--metrics", 
+        help="write a json report of the build metrics (stages, downloads, rewrites and indexing timings)", 
+        default = None,
+    )
+
+    parser.add_argument("--profile", 
+        help="dump cProfile stats of the build (main process only) in the given file", 
+        default = None,
+    )
+
+    parser.add_argument("--cache-dir", 
+        help="http cache folder, used to revalidate pages downloaded by previous runs", 
+        default = os.path.join(os.getcwd(), "_http_cache"),
+    )
+
+    parser.add_argument("--cache-max-size", 
+        help="http cache size limit, in MB", 
+        default = 1024,
+        type=int,
+    )
+
+    parser.add_argument("--no-cache", 
+        help="do not use the http cache", 
+        default=False, 
+        action="store_true"
+    )
+
+    parser.add_argument("--record", 
+        help="record every http response and rendered page of the build in the given fixtures folder", 
+        default = None,
+    )
+
+    parser.add_argument("--replay", 
+        help="build offline from the fixtures folder recorded by --record", 
+        default = None,
+    )
+
+    parser.add_argument("--replay-scale", 
+        help="replicate the recorded modules N times, to replay a larger synthetic corpus", 
+        default = 1,
+        type=int,
+    )
+
+    parser.add_argument("--benchmark", 
+        help="time the replayed build stages at the given corpus scales (e.g. 1 10 50), the results are written to --metrics", 
+        default = None,
+        type=int,
+        nargs='+'
+    )
+
+    parser.add_argument("--benchmark-baseline", 
+        help="previous --benchmark results, the build fails if a stage got slower than --benchmark-tolerance", 
+        default = None,
+    )
+
+    parser.add_argument("--benchmark-tolerance", 
+        help="allowed stage slowdown over the baseline, as a ratio (default : 0.25)", 
+        default = 0.25,
+        type=float,
+    )
+
+    parser.add_argument("--benchmark-floor", 
+        help="stage slowdowns shorter than this duration (in seconds) are ignored as noise (default : %.1f)" % benchmark_noise_floor, 
+        default = benchmark_noise_floor,
+        type=float,
+    )
+
     args = parser.parse_args()
     if args.verbose:
         logging.basicConfig(level=logging.DEBUG)
@@ -752,12 +4213,120 @@ if __name__ == '__main__':
     else:
         logging.basicConfig(level=logging.INFO)
 
-    conf = Configuration( args )
+    if args.shard and args.merge_shards:
+        parser.error("--shard and --merge-shards are mutually exclusive")
 
-    if args.temporary:
+    if args.watch and (args.shard or args.merge_shards or args.temporary):
+        parser.error("--watch cannot be used with --shard, --merge-shards nor --temporary")
 
-        with tempfile.TemporaryDirectory() as tmp_builddir:
-            conf.build_folder = tmp_builddir
-            main(conf)
-    else:
-        main(conf)
+    if args.search:
+        search_index = args.search_index or os.path.join(
+            os.getcwd(), 
+            "_build_%s" % max(args.version, key = version_key), 
+            "_4_ready_to_be_packaged", 
+            "%s.docset" % Configuration.docset_name
+        )
+        if os.path.isdir(search_index):
+            search_index = os.path.join(search_index, "Contents", "Resources", "docSet.dsidx")
+        if not os.path.isfile(search_index):
+            parser.error("docset database %s not found" % search_index)
+
+        start = time.perf_counter()
+        try:
+            results = search_full_text(search_index, args.search)
+        except sqlite3.OperationalError as e:
+            parser.error("cannot search %s (built without --full-text ?) : %s" % (search_index, e))
+        search_time = time.perf_counter() - start
+
+        for title, path, snippet in results:
+            print("%s (%s)\n    %s" % (title, path, snippet))
+        logging.info("%d results in %.2fms" % (len(results), search_time * 1000))
+        sys.exit(0)
+
+    if args.archive_latency:
+        archive_filepath = os.path.realpath(args.output)
+        if not os.path.isfile(archive_index_filepath(archive_filepath)):
+            parser.error("%s has no offset index, package it with --archive-index" % archive_filepath)
+
+        latency = archive_latency(archive_filepath)
+        logging.info("%d members, %d sampled : random access read %.2fms on average (max %.2fms), full extraction %.2fms" % (
+            latency['members'],
+            latency['samples'],
+            latency['mean_read_time'] * 1000,
+            latency['max_read_time'] * 1000,
+            latency['extraction_time'] * 1000,
+        ))
+        if args.metrics:
+            write_file_atomic(os.path.realpath(args.metrics), json.dumps(latency, indent = 2), "w", encoding = "utf8")
+        sys.exit(0)
+
+    # requests scheduling shared by every fetcher and every build, the retries budget being refilled 
+    # by build_versions, local replays are not rate limited
+    rate_limiter.configure(
+        max_rate = 0 if args.replay else args.max_rate, 
+        max_concurrency = max(1, args.jobs), 
+        max_retries = args.max_retries
+    )
+
+    if args.benchmark:
+        if not args.replay:
+            parser.error("--benchmark requires --replay")
+
+        results = run_benchmark(args)
+        if args.metrics:
+            write_file_atomic(os.path.realpath(args.metrics), json.dumps(results, indent = 2), "w", encoding = "utf8")
+
+        for scale, result in results['scales'].items():
+            for name, stage in result['stages'].items():
+                logging.info("%sx %s : %.1fs (cpu %.1fs)" % (scale, name, stage['wall_time'], stage['cpu_time']))
+
+        if args.benchmark_baseline:
+            with open(args.benchmark_baseline, 'r', encoding="utf8") as f:
+                baseline = json.load(f)
+
+            regressions = benchmark_regressions(results, baseline, args.benchmark_tolerance, args.benchmark_floor)
+            for regression in regressions:
+                logging.error("[benchmark] regression %s" % regression)
+            if regressions:
+                sys.exit(1)
+
+        sys.exit(0)
+
+    if args.watch:
+        args.version = sorted(set(args.version), key = version_key)
+        with PoshWebDriver(args.phantom, args.jobs) as posh_webdriver:
+            watcher = DocsetWatcher(args, posh_webdriver)
+            signal.signal(signal.SIGTERM, lambda signum, frame: watcher.stop())
+            try:
+                watcher.run()
+            except KeyboardInterrupt:
+                logging.info("[watch] interrupted")
+            finally:
+                watcher.close()
+        sys.exit(0)
+
+    profiler = None
+    if args.profile:
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    args.version = sorted(set(args.version), key = version_key)
+    with PoshWebDriver(args.phantom, args.jobs) as posh_webdriver:
+        built_versions = build_versions(args, posh_webdriver)
+
+    # shards are only packaged once merged
+    if args.shard:
+        built_versions = {}
+
+    publish_docsets(args, built_versions)
+
+    if profiler:
+        profiler.disable()
+        profiler.dump_stats(args.profile)
+
+    metrics.log_summary()
+    if args.metrics:
+        metrics.save(os.path.realpath(args.metrics))
+
+    if len(built_versions) < len(args.version) and not args.shard:
+        sys.exit(1)
@@ -0,0 +1,16 @@
+import importlib.util
+import os
+
+import pytest
+
+repository_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+fixtures_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+@pytest.fixture(scope = "session")
+def posh_to_dash():
+    """ posh-to-dash.py is a script, not an importable module """
+    spec = importlib.util.spec_from_file_location("posh_to_dash", os.path.join(repository_dir, "posh-to-dash.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
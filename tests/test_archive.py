@@ -0,0 +1,95 @@
+"""
+make_docset archives : ParallelGzipWriter output, and random access reads through the offset index 
+(DocsetArchiveReader), including the hardlinks written for deduplicated resources.
+"""
+
+import gzip
+import io
+import os
+import random
+import tarfile
+
+import pytest
+
+
+@pytest.fixture
+def docset_dir(tmp_path):
+    """ a small docset folder, with a deduplicated (hardlinked) asset and a page larger than an index block """
+    documents_dir = tmp_path / "Powershell.docset" / "Contents" / "Resources" / "Documents"
+    module_dir = documents_dir / "docs.microsoft.com" / "en-us" / "powershell" / "module" / "Microsoft.PowerShell.Management"
+    os.makedirs(str(module_dir / "media"))
+    os.makedirs(str(documents_dir / "docs.microsoft.com" / "en-us" / "media"))
+
+    (module_dir / "Get-ChildItem.html").write_text("<html><body><h1>Get-ChildItem</h1></body></html>")
+    (module_dir / "Get-Item.html").write_text("<html><body><h1>Get-Item</h1></body></html>")
+
+    # incompressible, spans several 256KB blocks
+    large_page = random.Random(0).getrandbits(8 * 600 * 1024).to_bytes(600 * 1024, "little")
+    (module_dir / "Microsoft.PowerShell.Management.html").write_bytes(large_page)
+
+    # the same image used by two pages, linked from a single stored copy (see AssetStore)
+    (documents_dir / "docs.microsoft.com" / "en-us" / "media" / "module.svg").write_bytes(b"<svg/>")
+    os.link(str(documents_dir / "docs.microsoft.com" / "en-us" / "media" / "module.svg"), str(module_dir / "media" / "module.svg"))
+
+    return str(tmp_path / "Powershell.docset")
+
+def source_files(docset_dir):
+    files = {}
+    for root, _, names in os.walk(docset_dir):
+        for name in names:
+            path = os.path.join(root, name)
+            arcname = "/".join(["Powershell.docset"] + os.path.relpath(path, docset_dir).split(os.sep))
+            with open(path, "rb") as f:
+                files[arcname] = f.read()
+    return files
+
+
+@pytest.mark.parametrize("jobs", [1, 4])
+def test_parallel_gzip_writer(posh_to_dash, jobs):
+    data = random.Random(1).getrandbits(8 * 3000 * 1000).to_bytes(3000 * 1000, "little") + b"docset" * 100000
+
+    compressed = io.BytesIO()
+    gz = posh_to_dash.ParallelGzipWriter(compressed, jobs = jobs, block_size = 256 * 1024)
+    gz.write(data[:1000])
+    gz.write(data[1000:])
+    gz.close()
+
+    assert gzip.decompress(compressed.getvalue()) == data
+
+def test_make_docset_is_reproducible(posh_to_dash, docset_dir, tmp_path):
+    archives = []
+    for jobs in (1, 4):
+        archive_filepath = str(tmp_path / ("Powershell-%d.tgz" % jobs))
+        posh_to_dash.make_docset(docset_dir, archive_filepath, jobs = jobs)
+        with open(archive_filepath, "rb") as f:
+            archives.append(f.read())
+
+    assert archives[0] == archives[1]
+
+def test_indexed_archive_reads(posh_to_dash, docset_dir, tmp_path):
+    archive_filepath = str(tmp_path / "Powershell.tgz")
+    posh_to_dash.make_docset(docset_dir, archive_filepath, jobs = 2, index_filepath = posh_to_dash.archive_index_filepath(archive_filepath))
+
+    expected = source_files(docset_dir)
+    link = "Powershell.docset/Contents/Resources/Documents/docs.microsoft.com/en-us/powershell/module/Microsoft.PowerShell.Management/media/module.svg"
+    with tarfile.open(archive_filepath, "r:gz") as tar:
+        assert tar.getmember(link).islnk()
+
+    with posh_to_dash.DocsetArchiveReader(archive_filepath) as reader:
+        assert reader.members() == sorted(expected)
+        for path, content in expected.items():
+            assert reader.read(path) == content
+        with pytest.raises(KeyError):
+            reader.read("Powershell.docset/missing.html")
+
+    latency = posh_to_dash.archive_latency(archive_filepath, samples = len(expected))
+    assert latency['members'] == latency['samples'] == len(expected)
+
+def test_archive_index_mismatch(posh_to_dash, docset_dir, tmp_path):
+    archive_filepath = str(tmp_path / "Powershell.tgz")
+    posh_to_dash.make_docset(docset_dir, archive_filepath, index_filepath = posh_to_dash.archive_index_filepath(archive_filepath))
+
+    # an archive packaged again without its index
+    posh_to_dash.make_docset(docset_dir, archive_filepath, compresslevel = 1)
+    with pytest.raises(ValueError):
+        posh_to_dash.DocsetArchiveReader(archive_filepath)
@@ -0,0 +1,132 @@
+"""
+FixtureStore and ReplayServer : recorded responses are stored content addressed and served back 
+by the local replay server, optionally replicated into a larger synthetic corpus.
+"""
+
+import json
+import os
+
+import pytest
+import requests
+
+from conftest import fixtures_dir
+
+replay_dir = os.path.join(fixtures_dir, "replay")
+
+toc_url = "https://docs.microsoft.com/en-us/powershell/module/psdocs/toc.json?view=powershell-7.1"
+page_url = "https://docs.microsoft.com/en-us/powershell/module/microsoft.powershell.management/get-item?view=powershell-7.1"
+
+
+class RecordedResponse:
+    """ the requests.Response attributes FixtureStore.record_response relies on """
+
+    def __init__(self, content : bytes, content_type : str = "text/html", status_code : int = 200):
+        self.content = content
+        self.status_code = status_code
+        self.headers = {'Content-Type' : content_type}
+
+
+@pytest.fixture
+def replay_server(posh_to_dash):
+    servers = []
+
+    def start(store, scale = 1):
+        server = posh_to_dash.ReplayServer(store, scale)
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+
+
+def recorded_toc():
+    return json.dumps({'items' : [{ 'children' : [{
+        'toc_title' : "Microsoft.PowerShell.Management",
+        'href' : "/en-us/powershell/module/microsoft.powershell.management/",
+        'children' : [
+            { 'toc_title' : "Get-Item", 'href' : "/en-us/powershell/module/microsoft.powershell.management/get-item" },
+            { 'toc_title' : "About", 'children' : [{ 'toc_title' : "about_Providers", 'href' : "about/about_providers" }] },
+        ],
+    }]}]}).encode("utf8")
+
+def test_fixture_store_round_trip(posh_to_dash, tmp_path):
+    store = posh_to_dash.FixtureStore(str(tmp_path))
+    store.record_response(page_url, RecordedResponse(b"<html>Get-Item</html>"))
+    store.record_response(page_url.replace("get-item", "get-location"), RecordedResponse(b"<html>Get-Item</html>"))
+    store.record_response(toc_url, RecordedResponse(b"", status_code = 404))
+    store.record_page("https://docs.microsoft.com/en-us/powershell/module/?view=powershell-7.1", "<html>rendered</html>")
+    store.save()
+
+    # bodies are content addressed, identical ones are stored once
+    assert len(os.listdir(os.path.join(str(tmp_path), "objects"))) == 3
+
+    reloaded = posh_to_dash.FixtureStore(str(tmp_path))
+    assert reloaded.response(page_url) == (200, "text/html", b"<html>Get-Item</html>")
+    assert reloaded.response(toc_url) == (404, "text/html", b"")
+    assert reloaded.response("https://docs.microsoft.com/unknown") is None
+    assert reloaded.page("https://docs.microsoft.com/en-us/powershell/module/?view=powershell-7.1") == "<html>rendered</html>"
+    with pytest.raises(KeyError):
+        reloaded.page("https://docs.microsoft.com/unknown")
+
+def test_replay_server_serves_recorded_responses(posh_to_dash, tmp_path, replay_server):
+    store = posh_to_dash.FixtureStore(str(tmp_path))
+    store.record_response(page_url, RecordedResponse(b"<html>Get-Item</html>", "text/html; charset=utf-8"))
+    store.record_response(toc_url, RecordedResponse(b"throttled", status_code = 429))
+    server = replay_server(store)
+
+    r = requests.get(server.local_url(page_url))
+    assert r.status_code == 200
+    assert r.headers['Content-Type'] == "text/html; charset=utf-8"
+    assert r.content == b"<html>Get-Item</html>"
+
+    # recorded errors are replayed as is, unrecorded urls are not found
+    assert requests.get(server.local_url(toc_url)).status_code == 429
+    assert requests.get(server.local_url("https://docs.microsoft.com/unknown")).status_code == 404
+
+def test_replay_server_scale(posh_to_dash, tmp_path, replay_server):
+    store = posh_to_dash.FixtureStore(str(tmp_path))
+    store.record_response(toc_url, RecordedResponse(recorded_toc(), "application/json"))
+    store.record_response(page_url, RecordedResponse(b"<html>Get-Item</html>"))
+    server = replay_server(store, scale = 3)
+
+    modules = json.loads(requests.get(server.local_url(toc_url)).content)['items'][0]['children']
+    assert [m['toc_title'] for m in modules] == ["Microsoft.PowerShell.Management", "Microsoft.PowerShell.Management_2", "Microsoft.PowerShell.Management_3"]
+
+    # copies are renamed, except the special toc entries, and served through a "_copy_<n>" path segment
+    copy = modules[2]
+    assert [c['toc_title'] for c in copy['children']] == ["Get-Item_3", "About"]
+    assert copy['children'][1]['children'][0]['href'] == "_copy_3/about/about_providers"
+
+    copy_url = posh_to_dash.urllib.parse.urljoin(toc_url, copy['children'][0]['href']) + "?view=powershell-7.1"
+    assert copy_url == "https://docs.microsoft.com/_copy_3/en-us/powershell/module/microsoft.powershell.management/get-item?view=powershell-7.1"
+    assert requests.get(server.local_url(copy_url)).content == b"<html>Get-Item</html>"
+
+def test_replay_corpus_is_complete(posh_to_dash, replay_server):
+    """ every page listed by the recorded tables of contents is recorded, see the CI benchmark """
+    store = posh_to_dash.FixtureStore(replay_dir)
+    server = replay_server(store)
+
+    for toc in (posh_to_dash.Configuration.docs_toc_url_for("7.1"), posh_to_dash.Configuration.windows_toc_url):
+        status, _, body = store.response(toc)
+        assert status == 200
+
+        for module in json.loads(body.decode("utf8"))['items'][0]['children']:
+            hrefs = [module['href']] + [c['href'] for c in module['children'] if c.get('href')]
+            hrefs += [t['href'] for c in module['children'] for t in c.get('children', [])]
+
+            for href in hrefs:
+                url = "%s?view=powershell-7.1" % posh_to_dash.urllib.parse.urljoin(toc, href)
+                assert requests.get(server.local_url(url)).status_code == 200, url
+
+def test_benchmark_regressions(posh_to_dash):
+    baseline = {'scales' : {'10' : {'stages' : {"[1] download" : {'wall_time' : 0.1}, "[2] rewrite" : {'wall_time' : 2.0}}}}}
+    results = {'scales' : {
+        '1' : {'stages' : {"[2] rewrite" : {'wall_time' : 9.0}}},
+        '10' : {'stages' : {"[1] download" : {'wall_time' : 0.4}, "[2] rewrite" : {'wall_time' : 3.2}}},
+    }}
+
+    # scales missing from the baseline are not gated, short slowdowns are noise
+    assert posh_to_dash.benchmark_regressions(results, baseline, 0.5, 0.5) == ["10x [2] rewrite : 2.00s -> 3.20s"]
+    assert posh_to_dash.benchmark_regressions(results, baseline, 0.5, 0.25) == ["10x [1] download : 0.10s -> 0.40s", "10x [2] rewrite : 2.00s -> 3.20s"]
+    assert posh_to_dash.benchmark_regressions(results, baseline, 1.0, 0.25) == ["10x [1] download : 0.10s -> 0.40s"]
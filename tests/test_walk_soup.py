@@ -0,0 +1,210 @@
+"""
+Rewritten pages against committed golden pages :
+
+    - golden/baseline : pages rewritten by the multi-pass rewrite_soup and rewrite_index_soup of the baseline
+      (the first commit of the history). walk_soup, driven by the same per-tag transformations, must give them back
+      byte for byte : it only changed how the tree is traversed.
+    - golden : pages, resources, symbols and links of the current rewrite_soup and rewrite_index_soup, so that a
+      change in any of their helpers shows up. Regenerate them with "python tests/test_walk_soup.py" and review the diff.
+"""
+
+import json
+import os
+import re
+import tempfile
+
+import pytest
+from bs4 import BeautifulSoup as bs
+
+from conftest import fixtures_dir, repository_dir
+
+pages_dir = os.path.join(fixtures_dir, "pages")
+golden_dir = os.path.join(fixtures_dir, "golden")
+baseline_golden_dir = os.path.join(golden_dir, "baseline")
+
+# fixture page -> path relative to the documents dir, like crawl_posh_contents stores them
+module_dir = os.path.join("docs.microsoft.com", "en-us", "powershell", "module")
+fixture_pages = {
+    "Get-ChildItem.html" : os.path.join(module_dir, "Microsoft.PowerShell.Management", "Get-ChildItem.html"),
+    "Microsoft.PowerShell.Management.html" : os.path.join(module_dir, "Microsoft.PowerShell.Management", "Microsoft.PowerShell.Management.html"),
+    "about_Aliases.html" : os.path.join(module_dir, "Microsoft.PowerShell.Core", "about", "about_Aliases.html"),
+    "Get-ADUser.html" : os.path.join(module_dir, "ActiveDirectory", "Get-ADUser.html"),
+}
+index_page = os.path.join("docs.microsoft.com", "en-us", "index.html")
+
+# powershell and windows server modules, see crawl_posh_contents
+content_toc_modules = {
+    "Microsoft.PowerShell.Management" : (["Get-ChildItem", "Get-Item"], []),
+    "Microsoft.PowerShell.Utility" : (["Write-Host"], []),
+    "Microsoft.PowerShell.Core" : ([], ["about_Aliases"]),
+    "ActiveDirectory" : (["Get-ADUser", "Set-ADUser"], []),
+}
+
+theme_uri = "_themes/docs.theme/master/en-us/_themes"
+
+
+def content_toc():
+    toc = {}
+    for module_name, (cmdlets, topics) in content_toc_modules.items():
+        toc[module_name] = {
+            'name' : module_name,
+            'index' : os.path.join(module_dir, module_name, "%s.html" % module_name),
+            'cmdlets' : [{ 'name' : name, 'path' : os.path.join(module_dir, module_name, "%s.html" % name)} for name in cmdlets],
+            'about' : [{ 'name' : name, 'path' : os.path.join(module_dir, module_name, "about", "%s.html" % name)} for name in topics],
+        }
+    return toc
+
+def load_soup(filename):
+    with open(os.path.join(pages_dir, filename), encoding = "utf8") as html_file:
+        return bs(html_file.read(), "html.parser")
+
+def read_golden(*path):
+    with open(os.path.join(*path), "rb") as golden_file:
+        return golden_file.read()
+
+def golden_name(filename, extension):
+    return "%s.%s" % (os.path.splitext(filename)[0], extension)
+
+
+@pytest.fixture(autouse = True)
+def link_resolver(posh_to_dash):
+    posh_to_dash.set_link_resolver(posh_to_dash.LinkResolver(content_toc()))
+    yield posh_to_dash.link_resolver
+    posh_to_dash.set_link_resolver(None)
+
+
+def rewrite_theme_stylesheet(link, html_path, documents_dir):
+    """ baseline theme stylesheet rewrite : relative link to the local copy """
+    uri_path = link['href'].strip()
+    if uri_path.lstrip('/').startswith(theme_uri):
+        css_filepath = os.path.join(documents_dir, "docs.microsoft.com", uri_path.lstrip('/'))
+        link['href'] = '/'.join(os.path.relpath(css_filepath, os.path.dirname(html_path)).split(os.sep))
+
+def baseline_visit_page(html_path, documents_dir):
+    """ per-tag transformations of the baseline rewrite_soup """
+    link_pattern = re.compile(r"([\w\.\/-]+)\?view=[powershell-|windowsserver2019-ps]")
+
+    def visit(tag, in_head):
+        if tag.name == "a" and tag.get("data-linktype") == "relative-path":
+            href = tag['href']
+            if href in ("./?view=powershell-7.1", "./?view=windowsserver2019-ps"):
+                tag['href'] = "./%s.html" % tag.text
+            elif link_pattern.findall(href):
+                tag['href'] = "%s.html" % link_pattern.findall(href)[0]
+
+        # links to external references are removed
+        elif tag.name == "a" and tag.get("data-linktype") == "absolute-path":
+            tag.replace_with(tag.text)
+            return False
+
+        elif in_head and tag.name == "script":
+            _ = tag.extract()
+            return False
+
+        elif in_head and tag.name == "link" and "stylesheet" in tag.get("rel", []):
+            rewrite_theme_stylesheet(tag, html_path, documents_dir)
+
+    return visit
+
+def baseline_visit_index(walk_soup, index_html_path, documents_dir):
+    """ per-tag transformations of the baseline rewrite_index_soup """
+    link_pattern = re.compile(r"/powershell/module/([\w\.\-]+)/\?view=powershell-")
+    module_svg_path = os.path.join(documents_dir, "docs.microsoft.com", "en-us", "media", "toolbars", "module.svg")
+
+    def visit_content_table(tag, in_head):
+        if tag.name == "a" and link_pattern.findall(tag['href']):
+            module_name = link_pattern.findall(tag['href'])[0].strip('/')
+            tag['href'] = "powershell/module/%s/%s.html" % (module_name, module_name)
+
+        elif tag.name == "img" and tag.get("alt") == "Module":
+            tag['src'] = os.path.relpath(module_svg_path, os.path.dirname(index_html_path))
+
+    def visit(tag, in_head):
+        if tag.name == "table" and "api-search-results" in tag.get("class", []):
+            walk_soup(tag, [], visit_content_table)
+
+        # the baseline meant to remove the body async scripts too, but extracted the last head script again instead
+        elif in_head and tag.name == "script":
+            _ = tag.extract()
+            return False
+
+        elif in_head and tag.name == "link" and "stylesheet" in tag.get("rel", []):
+            rewrite_theme_stylesheet(tag, index_html_path, documents_dir)
+
+    return visit
+
+
+@pytest.mark.parametrize("filename", sorted(fixture_pages))
+def test_walk_soup_baseline_page(posh_to_dash, tmp_path, filename):
+    documents_dir = str(tmp_path)
+    html_path = os.path.join(documents_dir, fixture_pages[filename])
+
+    soup = load_soup(filename)
+    posh_to_dash.walk_soup(soup, posh_to_dash.page_nav_elements, baseline_visit_page(html_path, documents_dir))
+
+    assert soup.encode() == read_golden(baseline_golden_dir, filename)
+
+def test_walk_soup_baseline_index(posh_to_dash, tmp_path):
+    documents_dir = str(tmp_path)
+    index_html_path = os.path.join(documents_dir, index_page)
+
+    soup = load_soup("index.html")
+    posh_to_dash.walk_soup(soup, posh_to_dash.index_nav_elements, baseline_visit_index(posh_to_dash.walk_soup, index_html_path, documents_dir))
+
+    assert soup.encode() == read_golden(baseline_golden_dir, "index.html")
+
+
+def rewrite_page(posh_to_dash, filename, documents_dir):
+    """ current rewrite of a fixture page : (html, json of its resources, symbols and links) """
+    html_path = os.path.join(documents_dir, fixture_pages[filename])
+    soup, resources, symbols, unresolved_links, link_resolutions = posh_to_dash.rewrite_soup(None, load_soup(filename), html_path, documents_dir)
+
+    rewrite = {
+        'resources' : sorted([r.url, r.path.replace(os.sep, '/')] for r in resources),
+        'symbols' : [list(symbol) for symbol in symbols],
+        'unresolved_links' : unresolved_links,
+        'links' : link_resolutions,
+    }
+    return soup.encode(), json.dumps(rewrite, indent = 2, sort_keys = True).encode("utf8")
+
+def rewrite_index(posh_to_dash, documents_dir):
+    """ current rewrite of the fixture start page : (html, json of its stylesheets) """
+    index_html_path = os.path.join(documents_dir, index_page)
+    soup, stylesheets = posh_to_dash.rewrite_index_soup(None, load_soup("index.html"), index_html_path, documents_dir)
+
+    rewrite = {'resources' : sorted([r.url, r.path.replace(os.sep, '/')] for r in stylesheets)}
+    return soup.encode(), json.dumps(rewrite, indent = 2, sort_keys = True).encode("utf8")
+
+@pytest.mark.parametrize("filename", sorted(fixture_pages))
+def test_rewrite_soup_golden(posh_to_dash, tmp_path, filename):
+    html, rewrite = rewrite_page(posh_to_dash, filename, str(tmp_path))
+
+    assert html == read_golden(golden_dir, filename)
+    assert rewrite == read_golden(golden_dir, golden_name(filename, "json"))
+
+def test_rewrite_index_soup_golden(posh_to_dash, tmp_path):
+    html, rewrite = rewrite_index(posh_to_dash, str(tmp_path))
+
+    assert html == read_golden(golden_dir, "index.html")
+    assert rewrite == read_golden(golden_dir, "index.json")
+
+
+if __name__ == '__main__':
+    import importlib.util
+
+    # regenerate the current golden pages
+    spec = importlib.util.spec_from_file_location("posh_to_dash", os.path.join(repository_dir, "posh-to-dash.py"))
+    posh_to_dash = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(posh_to_dash)
+    posh_to_dash.set_link_resolver(posh_to_dash.LinkResolver(content_toc()))
+
+    with tempfile.TemporaryDirectory() as documents_dir:
+        rewrites = {filename : rewrite_page(posh_to_dash, filename, documents_dir) for filename in fixture_pages}
+        rewrites["index.html"] = rewrite_index(posh_to_dash, documents_dir)
+
+    for filename, (html, rewrite) in sorted(rewrites.items()):
+        with open(os.path.join(golden_dir, filename), "wb") as golden_file:
+            golden_file.write(html)
+        with open(os.path.join(golden_dir, golden_name(filename, "json")), "wb") as golden_file:
+            golden_file.write(rewrite)
+        print("golden page %s written" % filename)